@@ -19,7 +19,8 @@
 
 import json
 import re
-import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from math import floor
 
 import fiobank
@@ -29,18 +30,102 @@ import thepay.dataApi
 import thepay.gateApi
 import thepay.payment
 from django.conf import settings
+from django.core.mail import mail_admins
 from django.core.serializers.json import DjangoJSONEncoder
+from django.db.transaction import atomic
 from django.shortcuts import redirect
-from django.utils.translation import gettext, gettext_lazy, override
+from django.utils.translation import get_language, gettext, gettext_lazy, override
 from fakturace.storage import InvoiceStorage, ProformaStorage
 
-from .models import Payment
+from .models import InvoiceJob, Payment
+from .repository import COMMIT_QUEUE
 from .utils import send_notification
 
 BACKENDS = {}
 PROFORMA_RE = re.compile("20[0-9]{7}")
 
 
+def render_invoice(invoice):
+    """Render invoice PDF, returns time it took."""
+    start = time.monotonic()
+    invoice.write_tex()
+    invoice.build_pdf()
+    return time.monotonic() - start
+
+
+def render_stored_invoice(storage, invoice_id):
+    invoice = storage.get(invoice_id)
+    return invoice, render_invoice(invoice)
+
+
+def finish_invoice_job(job, invoice):
+    with atomic(using="payments_db"):
+        backend = BACKENDS[job.payment.backend](job.payment)
+        backend.invoice = invoice
+        backend.finish_invoice(job.files)
+        job.delete()
+    return backend
+
+
+def process_invoice_jobs(workers=None, limit=None):
+    """
+    Render pending invoices in parallel.
+
+    Rendering happens in a worker pool, the invoices are then committed and the
+    notification sent from the calling thread once the PDF exists. Failed jobs
+    are retried up to PAYMENT_INVOICE_RETRIES times, then they are marked as
+    failed and reported to the admins. Returns status and rendering time for
+    each processed invoice.
+    """
+    jobs = (
+        InvoiceJob.objects.filter(failed=False).select_related("payment").order_by("pk")
+    )
+    if limit:
+        jobs = jobs[:limit]
+    storage = InvoiceStorage(settings.PAYMENT_FAKTURACE)
+    results = []
+    with (
+        COMMIT_QUEUE.batch(),
+        ThreadPoolExecutor(
+            max_workers=workers or settings.PAYMENT_INVOICE_WORKERS
+        ) as executor,
+    ):
+        futures = {
+            executor.submit(render_stored_invoice, storage, job.payment.invoice): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            result = {"invoice": job.payment.invoice, "duration": 0}
+            try:
+                invoice, result["duration"] = future.result()
+                backend = finish_invoice_job(job, invoice)
+            except Exception as error:
+                sentry_sdk.capture_exception(error)
+                job.attempts += 1
+                job.error = str(error)
+                job.failed = job.attempts >= settings.PAYMENT_INVOICE_RETRIES
+                job.save(update_fields=["attempts", "error", "failed"])
+                if job.failed:
+                    mail_admins(
+                        f"Weblate: rendering invoice {job.payment.invoice} failed",
+                        f"Gave up after {job.attempts} attempts: {job.error}\n",
+                    )
+                result["status"] = "failed"
+                results.append(result)
+                continue
+            result["status"] = "rendered"
+            results.append(result)
+            # Notify once the PDF exists
+            if job.notification:
+                try:
+                    with override(job.language or None):
+                        backend.send_notification(job.notification)
+                except Exception as error:
+                    sentry_sdk.capture_exception(error)
+    return results
+
+
 def get_backend(name):
     backend = BACKENDS[name]
     if backend.debug and not settings.PAYMENT_DEBUG:
@@ -125,10 +210,8 @@ class Backend:
         self.failure()
         return False
 
-    def generate_invoice(self, storage_class=InvoiceStorage, paid=True):
-        """Generate an invoice."""
-        if settings.PAYMENT_FAKTURACE is None:
-            return
+    def create_invoice(self, storage_class=InvoiceStorage):
+        """Allocate an invoice, returns list of created files."""
         storage = storage_class(settings.PAYMENT_FAKTURACE)
         customer = self.payment.customer
         customer_id = f"web-{customer.pk}"
@@ -154,31 +237,33 @@ class Backend:
             category=self.payment.extra.get("category", "weblate"),
             **self.get_invoice_kwargs(),
         )
-        invoice = storage.get(invoice_file)
-        invoice.write_tex()
-        invoice.build_pdf()
-        files = [contact_file, invoice_file, invoice.tex_path, invoice.pdf_path]
+        self.invoice = storage.get(invoice_file)
+        self.payment.invoice = self.invoice.invoiceid
+        return [contact_file, invoice_file]
+
+    def finish_invoice(self, files, paid=True):
+        """Mark rendered invoice as paid and commit it."""
+        invoice = self.invoice
+        files = [*files, invoice.tex_path, invoice.pdf_path]
         if paid:
             invoice.mark_paid(
                 json.dumps(self.payment.details, indent=2, cls=DjangoJSONEncoder)
             )
             files.append(invoice.paid_path)
 
-        self.payment.invoice = invoice.invoiceid
-        self.invoice = invoice
-
         # Commit to git
         self.git_commit(files, invoice)
 
+    def generate_invoice(self, storage_class=InvoiceStorage, paid=True):
+        """Generate an invoice."""
+        if settings.PAYMENT_FAKTURACE is None:
+            return
+        files = self.create_invoice(storage_class)
+        render_invoice(self.invoice)
+        self.finish_invoice(files, paid)
+
     def git_commit(self, files, invoice):
-        subprocess.run(
-            ["git", "add", "--", *files], check=True, cwd=settings.PAYMENT_FAKTURACE
-        )
-        subprocess.run(
-            ["git", "commit", "-m", f"Invoice {invoice.invoiceid}"],
-            check=True,
-            cwd=settings.PAYMENT_FAKTURACE,
-        )
+        COMMIT_QUEUE.commit(files, f"Invoice {invoice.invoiceid}")
 
     def send_notification(self, notification, include_invoice=True):
         kwargs = {"backend": self}
@@ -196,6 +281,18 @@ class Backend:
         if not self.recurring:
             self.payment.recurring = ""
 
+        if settings.PAYMENT_INVOICE_ASYNC and settings.PAYMENT_FAKTURACE:
+            # Render invoice and notify customer in process_invoices
+            files = self.create_invoice()
+            self.payment.save()
+            InvoiceJob.objects.create(
+                payment=self.payment,
+                files=files,
+                notification="payment_completed",
+                language=get_language() or "",
+            )
+            return
+
         self.generate_invoice()
         self.payment.save()
 
@@ -394,41 +491,90 @@ class FioBank(Backend):
             (gettext("Reference"), invoice.invoiceid),
         ]
 
+    @staticmethod
+    def get_proforma_ids(transaction):
+        matches = []
+        # Extract from message, variable symbol, sender reference and comment
+        # for manual pairing
+        for field in ("recipient_message", "variable_symbol", "reference", "comment"):
+            if transaction.get(field):
+                matches.extend(PROFORMA_RE.findall(transaction[field]))
+        # The same proforma is often referenced by several fields
+        return list(dict.fromkeys(f"P{match}" for match in matches))
+
     @classmethod
-    def fetch_payments(cls, from_date=None):
+    def fetch_payments(cls, from_date=None, dry_run=False):
+        """
+        Pair bank transactions with pending proformas.
+
+        All proformas are looked up in a single query and the paid markers are
+        committed together with the invoices at the end. Returns a report of
+        matched, underpaid and unmatched proformas.
+        """
         client = fiobank.FioBank(token=settings.FIO_TOKEN)
-        for transaction in client.last(from_date=from_date):
-            matches = []
-            # Extract from message
-            if transaction["recipient_message"]:
-                matches.extend(PROFORMA_RE.findall(transaction["recipient_message"]))
-            # Extract from variable symbol
-            if transaction["variable_symbol"]:
-                matches.extend(PROFORMA_RE.findall(transaction["variable_symbol"]))
-            # Extract from sender reference
-            if transaction.get("reference", None):
-                matches.extend(PROFORMA_RE.findall(transaction["reference"]))
-            # Extract from comment for manual pairing
-            if transaction["comment"]:
-                matches.extend(PROFORMA_RE.findall(transaction["comment"]))
-            # Process all matches
-            for proforma_id in matches:
-                proforma_id = f"P{proforma_id}"
-                try:
-                    related = Payment.objects.get(backend=cls.name, invoice=proforma_id)
-                    if related.state != Payment.PENDING:
-                        print(
-                            f"{proforma_id} not pending: {related.get_state_display()}"
-                        )
+        transactions = [
+            (transaction, cls.get_proforma_ids(transaction))
+            for transaction in client.last(from_date=from_date)
+        ]
+        candidates = {
+            proforma_id
+            for _transaction, matches in transactions
+            for proforma_id in matches
+        }
+        payments = {}
+        if candidates:
+            payments = {
+                payment.invoice: payment
+                for payment in Payment.objects.filter(
+                    backend=cls.name, invoice__in=candidates
+                ).select_related("customer")
+            }
+
+        report = {"matched": [], "underpaid": [], "unmatched": []}
+        # Proformas paid earlier in this fetch (duplicate transfers)
+        settled = set()
+        # Commit paid markers and generated invoices together
+        with COMMIT_QUEUE.batch():
+            for transaction, matches in transactions:
+                for proforma_id in matches:
+                    related = payments.get(proforma_id)
+                    if related is None:
+                        print(f"No matching payment for {proforma_id} found")
+                        report["unmatched"].append(proforma_id)
+                        continue
+                    if proforma_id in settled:
+                        print(f"{proforma_id} already paid by other transaction")
                         continue
 
+                    # Fetch current state, the prefetched one might be outdated
                     backend = cls(related)
+                    if backend.payment.state != Payment.PENDING:
+                        state = backend.payment.get_state_display()
+                        print(f"{proforma_id} not pending: {state}")
+                        continue
                     proforma = backend.get_proforma()
+                    paid = floor(float(proforma.total_amount)) <= transaction["amount"]
+                    report["matched" if paid else "underpaid"].append(proforma_id)
+                    if paid:
+                        settled.add(proforma_id)
+                    if dry_run:
+                        print(
+                            "{} {}: received={}, expected={}".format(
+                                "Matched" if paid else "Underpaid",
+                                proforma_id,
+                                transaction["amount"],
+                                proforma.total_amount,
+                            )
+                        )
+                        continue
+
                     proforma.mark_paid(
                         json.dumps(transaction, indent=2, cls=DjangoJSONEncoder)
                     )
-                    backend.git_commit([proforma.paid_path], proforma)
-                    if floor(float(proforma.total_amount)) <= transaction["amount"]:
+                    COMMIT_QUEUE.commit(
+                        [proforma.paid_path], f"Bank transaction for {proforma_id}"
+                    )
+                    if paid:
                         print(f"Received payment for {proforma_id}")
                         backend.payment.details["transaction"] = transaction
                         backend.success()
@@ -440,5 +586,4 @@ class FioBank(Backend):
                                 proforma.total_amount,
                             )
                         )
-                except Payment.DoesNotExist:
-                    print(f"No matching payment for {proforma_id} found")
+        return report
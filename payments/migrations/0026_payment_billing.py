@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-17 18:58
+
+from django.db import migrations, models
+
+
+def fill_billing(apps, schema_editor):
+    Payment = apps.get_model("payments", "Payment")
+    db_alias = schema_editor.connection.alias
+    payments = []
+    for payment in (
+        Payment.objects.using(db_alias)
+        .filter(extra__has_key="billing")
+        .only("pk", "extra")
+        .iterator()
+    ):
+        payment.billing = payment.extra["billing"]
+        payments.append(payment)
+    Payment.objects.using(db_alias).bulk_update(payments, ["billing"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0025_alter_payment_uuid"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="billing",
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(
+            code=fill_billing, reverse_code=migrations.RunPython.noop, elidable=True
+        ),
+    ]
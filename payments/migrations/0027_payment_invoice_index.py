@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0026_payment_billing"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="payment",
+            name="invoice",
+            field=models.CharField(
+                blank=True, db_index=True, default="", max_length=20
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0027_payment_invoice_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InvoiceJob",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("files", models.JSONField(default=list)),
+                ("notification", models.CharField(blank=True, max_length=100)),
+                ("language", models.CharField(blank=True, max_length=20)),
+                ("attempts", models.IntegerField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="payments.payment",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Invoice job",
+                "verbose_name_plural": "Invoice jobs",
+            },
+        ),
+    ]
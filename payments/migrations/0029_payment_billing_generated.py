@@ -0,0 +1,31 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:04
+
+import django.db.models.fields.json
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0028_invoicejob"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="payment",
+            name="billing",
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="billing",
+            field=models.GeneratedField(
+                db_index=True,
+                db_persist=True,
+                expression=django.db.models.functions.comparison.Cast(
+                    django.db.models.fields.json.KeyTextTransform("billing", "extra"),
+                    models.IntegerField(),
+                ),
+                output_field=models.IntegerField(null=True),
+            ),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-17 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payments", "0029_payment_billing_generated"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoicejob",
+            name="failed",
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -29,6 +29,8 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models, transaction
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
 from django.urls import reverse
 from django.utils.functional import cached_property
 from django.utils.translation import get_language, gettext_lazy, pgettext_lazy
@@ -223,10 +225,18 @@ class Payment(models.Model):
     repeat = models.ForeignKey(
         "Payment", on_delete=models.deletion.CASCADE, null=True, blank=True
     )
-    invoice = models.CharField(max_length=20, blank=True, default="")
+    invoice = models.CharField(max_length=20, blank=True, default="", db_index=True)
     amount_fixed = models.BooleanField(blank=True, default=False)
     start = models.DateField(blank=True, null=True)
     end = models.DateField(blank=True, null=True)
+    # Hosted Weblate billing from extra, computed by the database as the rows
+    # are written by Hosted Weblate as well
+    billing = models.GeneratedField(
+        expression=Cast(KeyTextTransform("billing", "extra"), models.IntegerField()),
+        output_field=models.IntegerField(null=True),
+        db_persist=True,
+        db_index=True,
+    )
 
     class Meta:
         ordering = ["-created"]
@@ -341,10 +351,36 @@ class Payment(models.Model):
         )
 
 
+class InvoiceJob(models.Model):
+    """Invoice waiting for rendering in the background."""
+
+    payment = models.ForeignKey(Payment, on_delete=models.deletion.CASCADE)
+    # Files created when allocating the invoice
+    files = models.JSONField(default=list)
+    notification = models.CharField(max_length=100, blank=True)
+    language = models.CharField(max_length=20, blank=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    # Gave up after PAYMENT_INVOICE_RETRIES attempts
+    failed = models.BooleanField(default=False, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Invoice job"
+        verbose_name_plural = "Invoice jobs"
+
+    def __str__(self):
+        return f"{self.payment.invoice}: {self.payment}"
+
+
 class PaymentConf(AppConf):
     DEBUG = False
     SECRET = "secret"  # noqa: S105
     FAKTURACE = None
+    # Render invoices using the process_invoices command
+    INVOICE_ASYNC = False
+    INVOICE_WORKERS = 4
+    INVOICE_RETRIES = 3
     THEPAY_MERCHANTID = None
     THEPAY_ACCOUNTID = None
     THEPAY_PASSWORD = None
@@ -0,0 +1,160 @@
+#
+# Copyright © Michal Čihař <michal@weblate.org>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Commit queue for the invoices repository.
+
+Invoices and paid markers are queued and committed in batches by a single
+writer, concurrent writers wait for each other instead of failing on the git
+index lock.
+"""
+
+import fcntl
+import logging
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from functools import cache
+
+from django.conf import settings
+
+LOGGER = logging.getLogger(__name__)
+
+
+@cache
+def get_lockfile(path):
+    """Lock file inside the git directory, it can be outside the worktree."""
+    git_dir = subprocess.run(
+        ["git", "rev-parse", "--absolute-git-dir"],
+        check=True,
+        cwd=path,
+        capture_output=True,
+        text=True,
+    ).stdout.strip()
+    return os.path.join(git_dir, "weblate-commit.lock")
+
+
+def commit_files(files, message, body=""):
+    """Commit files to the invoices repository."""
+    # Serialize with other processes
+    with open(get_lockfile(settings.PAYMENT_FAKTURACE), "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        subprocess.run(
+            ["git", "add", "--", *files], check=True, cwd=settings.PAYMENT_FAKTURACE
+        )
+        command = ["git", "commit", "-m", message]
+        if body:
+            command.extend(["-m", body])
+        subprocess.run(command, check=True, cwd=settings.PAYMENT_FAKTURACE)
+
+
+class CommitQueue:
+    def __init__(self):
+        # Protects the pending changes and metrics
+        self.lock = threading.Lock()
+        # Single writer
+        self.writer = threading.Lock()
+        # Batches are per thread and do not delay commits from other threads
+        self.local = threading.local()
+        self.files = {}
+        self.messages = []
+        self.commits = 0
+        self.committed = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, files, message):
+        """Queue files for the next commit."""
+        with self.lock:
+            self.files.update(dict.fromkeys(files))
+            self.messages.append(message)
+
+    def commit(self, files, message):
+        """Commit files, the commit is deferred inside batch()."""
+        self.add(files, message)
+        if not self.batches:
+            self.flush()
+
+    @property
+    def batches(self):
+        return getattr(self.local, "batches", 0)
+
+    @contextmanager
+    def batch(self):
+        """
+        Coalesce all commits inside the block into a single one.
+
+        When the block fails, the changes stay queued for the next flush.
+        """
+        self.local.batches = self.batches + 1
+        try:
+            yield
+        finally:
+            self.local.batches -= 1
+        if not self.local.batches:
+            self.flush()
+
+    def flush(self):
+        """Commit all pending changes, returns number of coalesced changes."""
+        with self.writer:
+            with self.lock:
+                files = list(self.files)
+                messages = self.messages
+                self.files = {}
+                self.messages = []
+            # Already committed by other thread
+            if not messages:
+                return 0
+            start = time.monotonic()
+            try:
+                if len(messages) == 1:
+                    commit_files(files, messages[0])
+                else:
+                    commit_files(
+                        files, f"{len(messages)} invoice changes", "\n".join(messages)
+                    )
+            except Exception:
+                LOGGER.exception("commit of %d invoice changes failed", len(messages))
+                # Keep the changes for the next flush
+                with self.lock:
+                    self.files = {**dict.fromkeys(files), **self.files}
+                    self.messages = messages + self.messages
+                raise
+            latency = time.monotonic() - start
+            with self.lock:
+                self.commits += 1
+                self.committed += len(messages)
+                self.last_latency = latency
+                self.max_latency = max(self.max_latency, latency)
+            return len(messages)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "depth": len(self.messages),
+                "pending_files": len(self.files),
+                "commits": self.commits,
+                "committed": self.committed,
+                "last_latency": self.last_latency,
+                "max_latency": self.max_latency,
+            }
+
+
+COMMIT_QUEUE = CommitQueue()
@@ -18,21 +18,35 @@
 #
 
 import json
-from copy import copy
+import os
+import subprocess
+import tempfile
+import threading
+from copy import copy, deepcopy
 from datetime import date
+from smtplib import SMTPRecipientsRefused, SMTPServerDisconnected
 
 import responses
 from django.core import mail
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.mail.backends import locmem
 from django.test import SimpleTestCase, TestCase
 from django.test.utils import override_settings
 
 from weblate_web.tests import TEST_FAKTURACE
 
-from .backends import FioBank, InvalidState, get_backend, list_backends
-from .models import Customer, Payment
-from .validators import validate_vatin
+from .backends import (
+    FioBank,
+    InvalidState,
+    get_backend,
+    list_backends,
+    process_invoice_jobs,
+)
+from .models import Customer, InvoiceJob, Payment
+from .repository import CommitQueue, get_lockfile
+from .utils import html_to_text, send_notification, send_notifications
+from .validators import VIES_CIRCUIT_KEY, cache_vies_data, validate_vatin
 
 CUSTOMER = {
     "name": "Michal Čihař",
@@ -242,6 +256,47 @@ class BackendTest(TestCase):
         backends = list_backends()
         self.assertGreater(len(backends), 0)
 
+    @override_settings(PAYMENT_INVOICE_ASYNC=True)
+    def test_invoice_async(self):
+        backend = get_backend("pay")(self.payment)
+        self.assertIsNone(backend.initiate(None, "", ""))
+        self.assertTrue(backend.complete(None))
+        payment = self.check_payment(Payment.ACCEPTED)
+        self.assertNotEqual(payment.invoice, "")
+        self.assertFalse(payment.invoice_filename_valid)
+        # Customer is notified once the invoice is rendered
+        self.assertEqual(len(mail.outbox), 0)
+        results = process_invoice_jobs()
+        self.assertEqual(results[0]["invoice"], payment.invoice)
+        self.assertEqual(results[0]["status"], "rendered")
+        self.assertFalse(InvoiceJob.objects.exists())
+        payment = self.check_payment(Payment.ACCEPTED)
+        self.assertTrue(payment.invoice_filename_valid)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, "Your payment on weblate.org")
+
+    @override_settings(
+        PAYMENT_INVOICE_RETRIES=2, ADMINS=[("Admin", "admin@example.com")]
+    )
+    def test_invoice_retry(self):
+        self.payment.invoice = "2000000001"
+        self.payment.save()
+        job = InvoiceJob.objects.create(
+            payment=self.payment, notification="payment_completed"
+        )
+        for _i in range(3):
+            process_invoice_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 2)
+        self.assertNotEqual(job.error, "")
+        self.assertTrue(job.failed)
+        # Only admins are notified about failed job
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            mail.outbox[0].subject,
+            "[weblate.org] Weblate: rendering invoice 2000000001 failed",
+        )
+
     @responses.activate
     def test_proforma(self):
         backend = get_backend("fio-bank")(self.payment)
@@ -263,6 +318,11 @@ class BackendTest(TestCase):
         transaction[1]["column16"]["value"] = proforma_id
         transaction[1]["column1"]["value"] = backend.payment.amount * 1.21
         responses.replace(responses.GET, FIO_API, body=json.dumps(received))
+        self.assertEqual(
+            FioBank.fetch_payments(dry_run=True),
+            {"matched": [proforma_id], "underpaid": [proforma_id], "unmatched": []},
+        )
+        self.check_payment(Payment.PENDING)
         FioBank.fetch_payments()
         payment = self.check_payment(Payment.ACCEPTED)
         self.maxDiff = None
@@ -272,6 +332,204 @@ class BackendTest(TestCase):
         self.assertEqual(len(mail.outbox), 1)
         self.assertEqual(mail.outbox[0].subject, "Your payment on weblate.org")
 
+    @responses.activate
+    def test_proforma_duplicate(self):
+        backend = get_backend("fio-bank")(self.payment)
+        self.assertIsNotNone(backend.initiate(None, "", "/complete/"))
+        mail.outbox = []
+
+        received = deepcopy(FIO_TRASACTIONS)
+        proforma_id = backend.payment.invoice
+        transaction = received["accountStatement"]["transactionList"]["transaction"]
+        # Both transfers reference the proforma in the message and the VS
+        for item in transaction:
+            item["column16"]["value"] = proforma_id
+            item["column5"]["value"] = proforma_id[1:]
+            item["column1"]["value"] = backend.payment.amount * 1.21
+        responses.add(responses.GET, FIO_API, body=json.dumps(received))
+        self.assertEqual(
+            FioBank.fetch_payments(),
+            {"matched": [proforma_id], "underpaid": [], "unmatched": []},
+        )
+        self.check_payment(Payment.ACCEPTED)
+        self.assertEqual(len(mail.outbox), 1)
+
+        # Later fetch does not process the payment again
+        self.assertEqual(
+            FioBank.fetch_payments(),
+            {"matched": [], "underpaid": [], "unmatched": []},
+        )
+        self.assertEqual(len(mail.outbox), 1)
+
+    @responses.activate
+    def test_proforma_unmatched(self):
+        received = deepcopy(FIO_TRASACTIONS)
+        transaction = received["accountStatement"]["transactionList"]["transaction"]
+        transaction[0]["column16"]["value"] = "200000001"
+        transaction[1]["column16"]["value"] = "Proforma 200000002"
+        responses.add(responses.GET, FIO_API, body=json.dumps(received))
+        with self.assertNumQueries(1, using="payments_db"):
+            report = FioBank.fetch_payments(dry_run=True)
+        self.assertEqual(
+            report,
+            {"matched": [], "underpaid": [], "unmatched": ["P200000001", "P200000002"]},
+        )
+
+
+class CommitQueueTest(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.repo = directory.name
+        for command in (
+            ["git", "init", "--quiet"],
+            ["git", "config", "user.email", "noreply@weblate.org"],
+            ["git", "config", "user.name", "Weblate"],
+        ):
+            subprocess.run(command, check=True, cwd=self.repo)
+        override = override_settings(PAYMENT_FAKTURACE=self.repo)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def create_file(self, name):
+        with open(os.path.join(self.repo, name), "w") as handle:
+            handle.write(name)
+        return name
+
+    def get_log(self):
+        return subprocess.run(
+            ["git", "log", "--format=%s"],
+            check=True,
+            cwd=self.repo,
+            capture_output=True,
+            text=True,
+        ).stdout.splitlines()
+
+    def test_commit(self):
+        queue = CommitQueue()
+        queue.commit([self.create_file("first")], "Invoice 1")
+        with queue.batch():
+            queue.commit([self.create_file("second")], "Invoice 2")
+            with queue.batch():
+                queue.commit([self.create_file("third")], "Invoice 3")
+            self.assertEqual(queue.metrics()["depth"], 2)
+            self.assertEqual(queue.metrics()["pending_files"], 2)
+        self.assertEqual(self.get_log(), ["2 invoice changes", "Invoice 1"])
+        metrics = queue.metrics()
+        self.assertEqual(metrics["depth"], 0)
+        self.assertEqual(metrics["commits"], 2)
+        self.assertEqual(metrics["committed"], 3)
+        self.assertGreater(metrics["max_latency"], 0)
+        self.assertEqual(queue.flush(), 0)
+
+    def test_failure(self):
+        queue = CommitQueue()
+        queue.add(["missing"], "Invoice 1")
+        with (
+            self.assertLogs("payments.repository", "ERROR"),
+            self.assertRaises(subprocess.CalledProcessError),
+        ):
+            queue.flush()
+        # Failed changes are kept for the next commit
+        self.assertEqual(queue.metrics()["depth"], 1)
+        self.create_file("missing")
+        queue.commit([self.create_file("first")], "Invoice 2")
+        self.assertEqual(self.get_log(), ["2 invoice changes"])
+        self.assertEqual(queue.metrics()["depth"], 0)
+
+    def test_batch_failure(self):
+        queue = CommitQueue()
+        with self.assertRaises(ValueError), queue.batch():
+            queue.commit([self.create_file("first")], "Invoice 1")
+            raise ValueError
+        # Changes from failed batch are kept for the next commit
+        self.assertEqual(queue.metrics()["depth"], 1)
+        queue.commit([self.create_file("second")], "Invoice 2")
+        self.assertEqual(self.get_log(), ["2 invoice changes"])
+
+    def test_batch_thread(self):
+        queue = CommitQueue()
+        with queue.batch():
+            queue.commit([self.create_file("first")], "Invoice 1")
+            # Batch in this thread does not delay commits from others
+            thread = threading.Thread(
+                target=queue.commit, args=([self.create_file("second")], "Invoice 2")
+            )
+            thread.start()
+            thread.join()
+            self.assertEqual(queue.metrics()["commits"], 1)
+        self.assertEqual(queue.metrics()["depth"], 0)
+        self.assertEqual(
+            get_lockfile(self.repo),
+            os.path.join(os.path.realpath(self.repo), ".git", "weblate-commit.lock"),
+        )
+        self.assertTrue(os.path.exists(get_lockfile(self.repo)))
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    opened = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connections = 0
+
+    def open(self):
+        FailingEmailBackend.opened += 1
+        self.connections += 1
+        return super().open()
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            if "fail@example.com" in message.to:
+                raise SMTPRecipientsRefused({"fail@example.com": (550, b"Unknown")})
+            if "idle@example.com" in message.to and self.connections == 1:
+                # Server closed the idle connection
+                raise SMTPServerDisconnected("Connection unexpectedly closed")
+        return super().send_messages(email_messages)
+
+
+@override_settings(EMAIL_BACKEND="payments.tests.FailingEmailBackend")
+class NotificationTest(SimpleTestCase):
+    def test_send_notifications(self):
+        FailingEmailBackend.opened = 0
+        failures = send_notifications(
+            [
+                ("expiring_subscriptions", [f"{name}@example.com"], {"expiry": []})
+                for name in ("first", "fail", "second")
+            ]
+        )
+        self.assertEqual(FailingEmailBackend.opened, 1)
+        self.assertEqual(
+            [message.to for message in mail.outbox],
+            [["first@example.com"], ["second@example.com"]],
+        )
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][1], ["fail@example.com"])
+        # Logos are shared between messages
+        self.assertEqual(mail.outbox[0].attachments[0], mail.outbox[1].attachments[0])
+
+        # Connection closed by the server is reopened
+        mail.outbox = []
+        failures = send_notifications(
+            [
+                ("expiring_subscriptions", [f"{name}@example.com"], {"expiry": []})
+                for name in ("idle", "second")
+            ]
+        )
+        self.assertEqual(failures, [])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(FailingEmailBackend.opened, 3)
+
+        # Failures are raised outside the batch
+        with self.assertRaises(SMTPRecipientsRefused):
+            send_notification("expiring_subscriptions", ["fail@example.com"], expiry=[])
+
+    def test_html_to_text(self):
+        self.assertIn("> Quote", html_to_text("<blockquote><p>Quote"))
+        # Unclosed tags do not leak into the next conversion
+        self.assertEqual(html_to_text("<p>Text</p><p>More</p>"), "Text\n\nMore\n\n")
+
 
 class VATTest(SimpleTestCase):
     def test_validation_invalid(self):
@@ -296,10 +554,33 @@ class VATTest(SimpleTestCase):
         )
         validate_vatin("CZ8003280318")
 
+    def test_circuit(self):
+        cache.delete_many(["VAT-CZ8003280318", "VAT-FAULT-CZ8003280318"])
+        cache.set("VAT-LAST-CZ8003280318", {"valid": True, "countryCode": "CZ"})
+        cache.set(VIES_CIRCUIT_KEY, True)
+        try:
+            # Last known result is served while the circuit is open
+            value = cache_vies_data("CZ8003280318")
+            self.assertTrue(value.vies_data["stale"])
+            validate_vatin("CZ8003280318")
+
+            # Fault is reported without any known result
+            cache.delete("VAT-LAST-CZ8003280318")
+            with self.assertRaisesRegex(ValidationError, "View service status"):
+                validate_vatin("CZ8003280318")
+            self.assertEqual(
+                cache.get("VAT-FAULT-CZ8003280318")["fault_message"],
+                "MS_UNAVAILABLE",
+            )
+        finally:
+            cache.delete_many([VIES_CIRCUIT_KEY, "VAT-FAULT-CZ8003280318"])
+
     def test_direct(self):
         # This test relies on the VAT validation service being alive
         # so we accept failure as well
-        cache.delete("VAT-CZ8003280318")
+        cache.delete_many(
+            ["VAT-CZ8003280318", "VAT-FAULT-CZ8003280318", "VAT-LAST-CZ8003280318"]
+        )
         try:
             validate_vatin("CZ8003280318")
         except ValidationError as error:
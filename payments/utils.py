@@ -26,11 +26,15 @@ weblate/utils/validators.py and weblate/utils/fields.py.
 
 import os.path
 import re
+import threading
+from contextlib import contextmanager
 from email.mime.image import MIMEImage
+from functools import cache
+from smtplib import SMTPServerDisconnected
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.validators import validate_email as validate_email_django
 from django.template.loader import render_to_string
 from django.utils.translation import get_language, get_language_bidi
@@ -39,6 +43,8 @@ from html2text import HTML2Text
 
 # Reject some suspicious e-mail addresses, based on checks enforced by Exim MTA
 EMAIL_BLACKLIST = re.compile(r"^([./|]|.*([@%!`#&?]|/\.\./))")
+# Per thread notification batch
+LOCAL = threading.local()
 
 
 def validate_email(value):
@@ -51,17 +57,9 @@ def validate_email(value):
         raise ValidationError(_("Enter a valid e-mail address."))
 
 
-def send_notification(notification, recipients, **kwargs):
-    if not recipients:
-        return
-
-    # HTML to text conversion
-    html2text = HTML2Text(bodywidth=78)
-    html2text.unicode_snob = True
-    html2text.ignore_images = True
-    html2text.pad_tables = True
-
-    # Logos
+@cache
+def get_email_images():
+    """Logo images included in e-mails, loaded once per process."""
     images = []
     for name in ("email-logo.png", "email-logo-footer.png"):
         filename = os.path.join(settings.STATIC_ROOT, name)
@@ -70,7 +68,19 @@ def send_notification(notification, recipients, **kwargs):
         image.add_header("Content-ID", f"<{name}@cid.weblate.org>")
         image.add_header("Content-Disposition", "inline", filename=name)
         images.append(image)
+    return tuple(images)
 
+
+def html_to_text(html):
+    # The converter keeps parser state, so it can not be reused
+    html2text = HTML2Text(bodywidth=78)
+    html2text.unicode_snob = True
+    html2text.ignore_images = True
+    html2text.pad_tables = True
+    return html2text.handle(html)
+
+
+def prepare_notification(notification, recipients, **kwargs):
     # Context and subject
     context = {
         "LANGUAGE_CODE": get_language(),
@@ -86,12 +96,12 @@ def send_notification(notification, recipients, **kwargs):
     # Prepare e-mail
     email = EmailMultiAlternatives(
         subject,
-        html2text.handle(body),
+        html_to_text(body),
         "billing@weblate.org",
         recipients,
     )
     email.mixed_subtype = "related"
-    for image in images:
+    for image in get_email_images():
         email.attach(image)
     email.attach_alternative(body, "text/html")
     # Include invoice PDF if exists
@@ -102,4 +112,63 @@ def send_notification(notification, recipients, **kwargs):
                 handle.read(),
                 "application/pdf",
             )
-    email.send()
+    return email
+
+
+def send_notification(notification, recipients, **kwargs):
+    if not recipients:
+        return
+
+    email = prepare_notification(notification, recipients, **kwargs)
+    batch = getattr(LOCAL, "batch", None)
+    if batch is None:
+        email.send()
+        return
+
+    # Deliver using the batch connection, failures are collected
+    connection, failures = batch
+    email.connection = connection
+    try:
+        try:
+            email.send()
+        except SMTPServerDisconnected:
+            # The server closed the idle connection, reconnect once
+            connection.close()
+            connection.open()
+            email.send()
+    except Exception as error:
+        failures.append((notification, recipients, error))
+
+
+@contextmanager
+def notification_batch():
+    """
+    Deliver notifications sent inside the block over a single connection.
+
+    Yields list of failed deliveries as (notification, recipients, error).
+    """
+    if getattr(LOCAL, "batch", None) is not None:
+        # Nested batch
+        yield LOCAL.batch[1]
+        return
+    connection = get_connection()
+    failures = []
+    LOCAL.batch = (connection, failures)
+    try:
+        with connection:
+            yield failures
+    finally:
+        LOCAL.batch = None
+
+
+def send_notifications(notifications):
+    """
+    Send many notifications over a single connection.
+
+    Accepts (notification, recipients, kwargs) tuples and returns list of
+    failed deliveries.
+    """
+    with notification_batch() as failures:
+        for notification, recipients, kwargs in notifications:
+            send_notification(notification, recipients, **kwargs)
+    return failures
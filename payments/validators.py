@@ -6,30 +6,83 @@ from django.utils.translation import gettext as _
 from vies.types import VATIN
 from zeep.exceptions import Error
 
+# Answers from VIES are kept for a long time, registrations rarely change
+VIES_VALID_TIMEOUT = 30 * 86400
+VIES_INVALID_TIMEOUT = 86400
+# Last known answer is served while VIES is failing
+VIES_LAST_TIMEOUT = 365 * 86400
+# Faults are cached briefly to avoid hammering the failing service
+VIES_FAULT_TIMEOUT = 300
+# Consecutive faults opening the circuit breaker and how long it stays open
+VIES_CIRCUIT_FAULTS = 5
+VIES_CIRCUIT_TIMEOUT = 300
+VIES_CIRCUIT_KEY = "VIES-CIRCUIT"
+VIES_FAULTS_KEY = "VIES-FAULTS"
+VIES_UNAVAILABLE = {
+    "valid": False,
+    "fault_code": "other:Error",
+    "fault_message": "MS_UNAVAILABLE",
+}
 
-def cache_vies_data(value):
+
+def record_vies_fault():
+    try:
+        faults = cache.incr(VIES_FAULTS_KEY)
+    except ValueError:
+        faults = 1
+        cache.set(VIES_FAULTS_KEY, faults, VIES_CIRCUIT_TIMEOUT)
+    if faults >= VIES_CIRCUIT_FAULTS:
+        cache.set(VIES_CIRCUIT_KEY, True, VIES_CIRCUIT_TIMEOUT)
+
+
+def query_vies(value):
+    if cache.get(VIES_CIRCUIT_KEY):
+        return None
+    try:
+        data = {}
+        for item in value.data:
+            data[item] = value.data[item]
+    except Error as error:
+        record_vies_fault()
+        sentry_sdk.capture_exception()
+        return {
+            "valid": False,
+            "fault_code": getattr(error, "code", "other:Error"),
+            "fault_message": str(error),
+        }
+    cache.delete(VIES_FAULTS_KEY)
+    return data
+
+
+def cache_vies_data(value, refresh=False):
     if isinstance(value, str):
         value = VATIN.from_str(value)
     key = f"VAT-{value}"
-    data = cache.get(key)
+    fault_key = f"VAT-FAULT-{value}"
+    last_key = f"VAT-LAST-{value}"
+    cached = {} if refresh else cache.get_many([key, fault_key])
+    data = cached.get(key)
     if data is None:
         try:
             value.verify_country_code()
             value.verify_regex()
         except ValidationError:
             return value
-        try:
-            data = {}
-            for item in value.data:
-                data[item] = value.data[item]
-            cache.set(key, data, 3600)
-        except Error as error:
-            data = {
-                "valid": False,
-                "fault_code": getattr(error, "code", "other:Error"),
-                "fault_message": str(error),
-            }
-            sentry_sdk.capture_exception()
+        data = cached.get(fault_key)
+        if data is None:
+            data = query_vies(value)
+            if data is None:
+                data = VIES_UNAVAILABLE
+            elif "fault_code" not in data:
+                timeout = VIES_VALID_TIMEOUT if data["valid"] else VIES_INVALID_TIMEOUT
+                cache.set(key, data, timeout)
+                cache.set(last_key, data, VIES_LAST_TIMEOUT)
+            if "fault_code" in data:
+                cache.set(fault_key, data, VIES_FAULT_TIMEOUT)
+        if "fault_code" in data:
+            last = cache.get(last_key)
+            if last is not None:
+                data = {**last, "stale": True}
     value.__dict__["vies_data"] = data
 
     return value
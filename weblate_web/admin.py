@@ -75,11 +75,11 @@ class ServiceAdmin(admin.ModelAdmin):
     list_filter = ("status", "discoverable")
     search_fields = (
         "users__email",
-        "report__site_url",
-        "report__site_title",
         "site_url",
+        "site_title",
         "note",
     )
+    list_select_related = ("latest_report",)
     date_hierarchy = "created"
     autocomplete_fields = ("users",)
     inlines = (ProjectAdmin,)
@@ -94,9 +94,8 @@ class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ("service", "package", "created", "expires", "get_amount")
     search_fields = (
         "service__users__email",
-        "service__report__site_url",
-        "service__report__site_title",
         "service__site_url",
+        "service__site_title",
         "service__note",
     )
 
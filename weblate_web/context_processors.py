@@ -17,31 +17,33 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+from functools import lru_cache
 from math import ceil
 
 from django.conf import settings
-from django.urls import reverse
+from django.urls import get_script_prefix, reverse
 from django.utils.functional import SimpleLazyObject
 from django.utils.translation import override
 
-from weblate_web.models import Donation
-from weblate_web.remote import get_activity, get_changes, get_contributors, get_release
+from weblate_web.models import get_footer
+from weblate_web.remote import get_changes, get_contributors, get_release
 
 
-def weblate_web(request):
-    if request.resolver_match and request.resolver_match.url_name:
-        match = request.resolver_match
-        url_name = ":".join([*match.namespaces, match.url_name])
-        url_kwargs = match.kwargs
-    else:
-        url_name = "home"
-        url_kwargs = {}
+@lru_cache(maxsize=1024)
+def get_language_urls(url_name: str, url_kwargs: tuple, script_prefix: str):
+    """
+    Return canonical and per language URLs for the view.
+
+    The result depends only on the arguments, so it is cached to avoid
+    resolving the URL for every language on every request.
+    """
+    kwargs = dict(url_kwargs)
 
     # Get canonical URl, unfortunately there seems to be no clean
     # way, so just strip /en/ from the URL
     # See also https://stackoverflow.com/a/27727877/225718
     with override("en"):
-        canonical_url = reverse(url_name, kwargs=url_kwargs)
+        canonical_url = reverse(url_name, kwargs=kwargs)
         if canonical_url.startswith("/en/"):
             canonical_url = canonical_url[3:]
 
@@ -52,23 +54,45 @@ def weblate_web(request):
                 {
                     "name": name,
                     "code": code,
-                    "url": reverse(url_name, kwargs=url_kwargs),
+                    "url": reverse(url_name, kwargs=kwargs),
                 }
             )
 
     language_col = ceil(len(settings.LANGUAGES) / 3)
+    language_columns = [
+        language_urls[:language_col],
+        language_urls[language_col : language_col * 2],
+        language_urls[language_col * 2 :],
+    ]
+
+    return canonical_url, language_urls, language_columns
+
+
+def weblate_web(request):
+    if request.resolver_match and request.resolver_match.url_name:
+        match = request.resolver_match
+        url_name = ":".join([*match.namespaces, match.url_name])
+        url_kwargs = match.kwargs
+    else:
+        url_name = "home"
+        url_kwargs = {}
+
+    args = (url_name, tuple(sorted(url_kwargs.items())), get_script_prefix())
+    try:
+        hash(args)
+    except TypeError:
+        # Extra view arguments (such as sitemaps) can not be used as a key
+        urls = get_language_urls.__wrapped__(*args)
+    else:
+        urls = get_language_urls(*args)
+    canonical_url, language_urls, language_columns = urls
 
     return {
         "downloads": SimpleLazyObject(get_release),
         "canonical_url": canonical_url,
         "language_urls": language_urls,
-        "donate_links": Donation.objects.filter(active=True, reward=3),
-        "activity_sum": sum(get_activity()[-7:]),
+        "footer": SimpleLazyObject(get_footer),
         "contributors": SimpleLazyObject(get_contributors),
         "changes": SimpleLazyObject(get_changes),
-        "language_columns": [
-            language_urls[:language_col],
-            language_urls[language_col : language_col * 2],
-            language_urls[language_col * 2 :],
-        ],
+        "language_columns": language_columns,
     }
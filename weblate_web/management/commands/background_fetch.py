@@ -17,29 +17,148 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+import resource
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import timedelta
 
+import sentry_sdk
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from weblate_web.models import Service
-from weblate_web.remote import get_activity, get_changes, get_contributors, get_release
+from weblate_web.models import Service, update_discover
+from weblate_web.remote import REQUEST_TIMEOUT, SOURCES, refresh_cached
 
 
 class Command(BaseCommand):
     help = "refreshes remote data"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--parallel",
+            action="store_true",
+            help="Fetch remote sources concurrently",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Number of concurrent fetches in parallel mode",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=60,
+            help="Time to wait for all sources in parallel mode (in seconds)",
+        )
+
     def disable_stale_services(self):
         threshold = timezone.now() - timedelta(days=3)
-        for service in Service.objects.filter(discoverable=True):
+        for service in Service.objects.filter(discoverable=True).select_related(
+            "latest_report"
+        ):
             if service.last_report and service.last_report.timestamp < threshold:
                 service.discoverable = False
                 service.save(update_fields=["discoverable"])
                 self.stdout.write(f"Disabling disoverable for {service}")
 
-    def handle(self, *args, **options):
+    @staticmethod
+    def fetch_source(name, fetcher=None, started=None, deadline=None):
+        key, source_fetcher = SOURCES[name]
+        stats = {"status": "-", "bytes": 0, "cached": False}
+        start = time.monotonic()
+        if started is not None:
+            started[name] = start
+        if deadline is not None:
+            # Limit the HTTP requests to the remaining time
+            stats["timeout"] = max(min(deadline - start, REQUEST_TIMEOUT), 1)
+        try:
+            stats["cached"] = refresh_cached(
+                key, fetcher or source_fetcher, force=True, stats=stats
+            )
+        except Exception as error:
+            sentry_sdk.capture_exception(error)
+            stats["status"] = "error"
+        stats["duration"] = time.monotonic() - start
+        return stats
+
+    def fetch_parallel(self, workers, timeout):
+        started = {}
+        finished = set()
+        expired = False
+        lock = threading.Lock()
+        deadline = time.monotonic() + timeout
+
+        def guard(name):
+            fetcher = SOURCES[name][1]
+
+            def fetch(stats):
+                data = fetcher(stats)
+                with lock:
+                    if expired:
+                        # Result arrived after the deadline, keep cached data
+                        return None
+                    finished.add(name)
+                return data
+
+            return fetch
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                executor.submit(
+                    self.fetch_source, name, guard(name), started, deadline
+                ): name
+                for name in SOURCES
+            }
+            # Database cleanup runs while the fetches are in progress
+            self.disable_stale_services()
+            wait(futures, timeout=max(deadline - time.monotonic(), 0))
+            with lock:
+                expired = True
+        finally:
+            # Do not wait for timed out fetches, their HTTP requests are
+            # limited by the remaining time
+            executor.shutdown(wait=False, cancel_futures=True)
+        now = time.monotonic()
+        results = {}
+        for future, name in futures.items():
+            if (future.done() and not future.cancelled()) or name in finished:
+                # Finished fetches are storing the result
+                results[name] = future.result()
+            else:
+                results[name] = {
+                    "status": "timeout",
+                    "bytes": 0,
+                    "cached": False,
+                    "duration": now - started[name] if name in started else 0,
+                }
+        return results
+
+    def fetch_serial(self):
         self.disable_stale_services()
-        get_contributors(force=True)
-        get_activity(force=True)
-        get_changes(force=True)
-        get_release(force=True)
+        return {name: self.fetch_source(name) for name in SOURCES}
+
+    def handle(self, *args, **options):
+        # Peak resident size of the process, in kilobytes on Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if options["parallel"]:
+            results = self.fetch_parallel(options["workers"], options["timeout"])
+        else:
+            results = self.fetch_serial()
+        # Rotate discover projects sample and pick up discoverability changes
+        update_discover()
+        for name, stats in results.items():
+            report = "{}: status {}, {:.2f}s, {} bytes, cache {}".format(
+                name,
+                stats["status"],
+                stats["duration"],
+                stats["bytes"],
+                "updated" if stats["cached"] else "kept",
+            )
+            if "parse_time" in stats:
+                report = "{}, parsed in {:.2f}s".format(report, stats["parse_time"])
+            self.stdout.write(report)
+        current = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write(f"peak memory {current} kB, grown by {current - peak} kB")
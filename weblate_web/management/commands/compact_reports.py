@@ -0,0 +1,42 @@
+#
+# Copyright © Michal Čihař <michal@weblate.org>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from weblate_web.models import compact_reports
+
+
+class Command(BaseCommand):
+    help = "rolls up old reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of rows processed in a single transaction",
+        )
+
+    def handle(self, *args, **options):
+        result = compact_reports(options["chunk_size"])
+        self.stdout.write(
+            "Rolled up {} reports and {} daily rollups".format(
+                result["reports"], result["days"]
+            )
+        )
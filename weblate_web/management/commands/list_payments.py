@@ -27,7 +27,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         # Expiring subscriptions
-        subscriptions = Subscription.objects.exclude(payment=None)
+        subscriptions = Subscription.objects.exclude(payment=None).prefetch_payments()
         for subscription in subscriptions:
             # Skip one-time payments and the ones with recurrence configured
             if not subscription.get_repeat():
@@ -49,7 +49,11 @@ class Command(BaseCommand):
             )
 
         # Expiring donations
-        donations = Donation.objects.filter(active=True).exclude(payment=None)
+        donations = (
+            Donation.objects.filter(active=True)
+            .exclude(payment=None)
+            .prefetch_payments()
+        )
         for donation in donations:
             payment = donation.payment_obj
             if payment.backend != "thepay-card":
@@ -0,0 +1,59 @@
+#
+# Copyright © Michal Čihař <michal@weblate.org>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from payments.backends import process_invoice_jobs
+from payments.repository import COMMIT_QUEUE
+
+
+class Command(BaseCommand):
+    help = "renders queued invoices"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of invoices rendered in parallel",
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximal number of invoices to render",
+        )
+
+    def handle(self, *args, **options):
+        if settings.PAYMENT_FAKTURACE is None:
+            return
+        for result in process_invoice_jobs(options["workers"], options["limit"]):
+            self.stdout.write(
+                "{}: {}, {:.2f}s".format(
+                    result["invoice"], result["status"], result["duration"]
+                )
+            )
+        COMMIT_QUEUE.flush()
+        metrics = COMMIT_QUEUE.metrics()
+        if metrics["commits"]:
+            self.stdout.write(
+                "Committed {committed} invoice changes in {commits} commits, "
+                "slowest took {max_latency:.2f}s".format(**metrics)
+            )
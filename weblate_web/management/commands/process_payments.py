@@ -24,11 +24,13 @@ from django.utils import timezone
 
 from payments.backends import FioBank
 from payments.models import Payment
+from payments.repository import COMMIT_QUEUE
 from weblate_web.models import (
     PAYMENTS_ORIGIN,
     Donation,
     process_donation,
     process_subscription,
+    update_footer,
 )
 
 
@@ -41,14 +43,36 @@ class Command(BaseCommand):
             default=None,
             help="Date for parsing bank statements",
         )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report matching of bank statements",
+        )
 
     def handle(self, *args, **options):
         if settings.FIO_TOKEN:
             with transaction.atomic(using="payments_db"):
-                FioBank.fetch_payments(from_date=options["from_date"])
+                report = FioBank.fetch_payments(
+                    from_date=options["from_date"], dry_run=options["dry_run"]
+                )
+            if options["dry_run"]:
+                counts = {key: len(value) for key, value in report.items()}
+                self.stdout.write(
+                    "Matched {matched}, underpaid {underpaid}, "
+                    "unmatched {unmatched} proformas".format(**counts)
+                )
+        if options["dry_run"]:
+            return
         with transaction.atomic(using="payments_db"):
             self.pending()
         self.active()
+        COMMIT_QUEUE.flush()
+        metrics = COMMIT_QUEUE.metrics()
+        if metrics["commits"]:
+            self.stdout.write(
+                "Committed {committed} invoice changes in {commits} commits, "
+                "slowest took {max_latency:.2f}s".format(**metrics)
+            )
 
     @staticmethod
     def pending():
@@ -65,6 +89,9 @@ class Command(BaseCommand):
     @staticmethod
     def active():
         # Adjust active flag
-        Donation.objects.filter(active=True, expires__lt=timezone.now()).update(
-            active=False
-        )
+        updated = Donation.objects.filter(
+            active=True, expires__lt=timezone.now()
+        ).update(active=False)
+        # Bulk update does not trigger signals
+        if updated:
+            update_footer()
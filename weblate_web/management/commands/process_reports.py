@@ -0,0 +1,41 @@
+#
+# Copyright © Michal Čihař <michal@weblate.org>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+
+from django.core.management.base import BaseCommand
+
+from weblate_web.models import process_pending_reports, refresh_discover
+
+
+class Command(BaseCommand):
+    help = "processes queued reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Maximal number of reports to process",
+        )
+
+    def handle(self, *args, **options):
+        processed = process_pending_reports(options["limit"])
+        # Pick up discoverability and project changes from the reports
+        refresh_discover()
+        self.stdout.write(f"Processed {processed} reports")
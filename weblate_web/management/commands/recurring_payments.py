@@ -19,33 +19,89 @@
 
 from __future__ import annotations
 
+import time
+from contextlib import ExitStack, contextmanager
 from datetime import timedelta
 
 from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
 from django.utils import timezone
 
 from payments.models import Payment
-from payments.utils import send_notification
-from weblate_web.models import Donation, Service, Subscription
+from payments.utils import notification_batch, send_notification
+from weblate_web.models import (
+    Donation,
+    Service,
+    Subscription,
+    get_obsolete_subscriptions,
+    prefetch_packages,
+    update_services_status,
+)
 
 
 class Command(BaseCommand):
     help = "issues recurring payments"
 
+    def report_failures(self, failures):
+        for notification, recipients, error in failures:
+            self.stderr.write(
+                "Failed to send {} to {}: {}".format(
+                    notification, ", ".join(recipients), error
+                )
+            )
+
     def handle(self, *args, **options):
         # Issue recurring payments
-        self.handle_donations()
-        self.handle_subscriptions()
+        with notification_batch() as failures:
+            self.handle_donations()
+        self.report_failures(failures)
+        with notification_batch() as failures:
+            self.handle_subscriptions()
+        self.report_failures(failures)
         # Update services status
-        self.handle_services()
+        changed = self.handle_services()
+        if changed:
+            self.stdout.write(f"Updated status of {changed} services")
         # Notify about upcoming expiry on Monday and Thursday
         weekday = timezone.now().date().weekday()
         if weekday in {0, 3}:
-            self.notify_expiry(weekday)
+            stats = self.notify_expiry(weekday)
+            self.stdout.write(
+                "Notified about expiry in {:.2f}s using {} queries".format(
+                    stats["duration"], stats["queries"]
+                )
+            )
+            self.report_failures(stats["failures"])
 
     @staticmethod
-    def notify_expiry(weekday=0):
+    @contextmanager
+    def count_queries():
+        """Count queries executed on all databases and measure the duration."""
+        stats = {"queries": 0}
+
+        def counter(execute, sql, params, many, context):
+            stats["queries"] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            start = time.monotonic()
+            yield stats
+            stats["duration"] = time.monotonic() - start
+
+    @classmethod
+    def notify_expiry(cls, weekday=0):
+        # All notifications are delivered over a single connection
+        with cls.count_queries() as stats, notification_batch() as failures:
+            cls.notify_expiry_pass(weekday)
+        stats["failures"] = failures
+        return stats
+
+    @staticmethod
+    def notify_expiry_pass(weekday):
         expiry = []
 
         expires_notify = timezone.now() + timedelta(days=30)
@@ -58,9 +114,14 @@ class Command(BaseCommand):
             payment_notify_end = timezone.now() + timedelta(days=11)
 
         # Expiring subscriptions
-        subscriptions = Subscription.objects.filter(
-            expires__lte=expires_notify, enabled=True
-        ).exclude(payment=None)
+        subscriptions = prefetch_packages(
+            Subscription.objects.filter(expires__lte=expires_notify, enabled=True)
+            .exclude(payment=None)
+            .select_related("service")
+            .prefetch_related("service__users")
+            .prefetch_payments()
+        )
+        obsolete = get_obsolete_subscriptions(subscriptions)
         for subscription in subscriptions:
             payment = subscription.payment_obj
             # Skip one-time payments and the ones with recurrence configured
@@ -75,22 +136,25 @@ class Command(BaseCommand):
                 continue
             if notify_user:
                 subscription.send_notification("payment_missing")
-            if not subscription.could_be_obsolete():
+            if subscription.pk not in obsolete:
                 name = f"{subscription}"
                 if subscription.service.note:
                     name = f"{name} ({subscription.service.note})"
                 expiry.append(
                     (
                         name,
-                        subscription.service.users.values_list("email", flat=True),
+                        [user.email for user in subscription.service.users.all()],
                         subscription.expires,
                     )
                 )
 
         # Expiring donations
-        donations = Donation.objects.filter(
-            active=True, expires__lte=expires_notify
-        ).exclude(payment=None)
+        donations = (
+            Donation.objects.filter(active=True, expires__lte=expires_notify)
+            .exclude(payment=None)
+            .select_related("user")
+            .prefetch_payments()
+        )
         for donation in donations:
             payment = donation.payment_obj
             notify_user = payment_notify_start <= donation.expires <= payment_notify_end
@@ -118,9 +182,20 @@ class Command(BaseCommand):
 
     @staticmethod
     def handle_services():
-        for service in Service.objects.all():
-            service.update_status()
+        changed = update_services_status()
+        # Provision backups for eligible services which do not have it yet
+        services = (
+            Service.objects.filter(backup_repository="", report__isnull=False)
+            .filter(
+                Q(subscription__package="backup")
+                | Q(subscription__package__startswith="hosted:"),
+                subscription__expires__gt=timezone.now(),
+            )
+            .distinct()
+        )
+        for service in services:
             service.create_backup()
+        return len(changed)
 
     @staticmethod
     def peform_payment(payment, past_payments, amount: int | None = None):
@@ -149,10 +224,14 @@ class Command(BaseCommand):
     @classmethod
     def handle_subscriptions(cls):
         now = timezone.now()
-        subscriptions = Subscription.objects.filter(
-            expires__range=(now - timedelta(days=10), now + timedelta(days=3)),
-            enabled=True,
-        ).exclude(payment=None)
+        subscriptions = (
+            Subscription.objects.filter(
+                expires__range=(now - timedelta(days=10), now + timedelta(days=3)),
+                enabled=True,
+            )
+            .exclude(payment=None)
+            .prefetch_payments()
+        )
         for subscription in subscriptions:
             # Is this repeating subscription?
             if not subscription.get_repeat():
@@ -178,9 +257,13 @@ class Command(BaseCommand):
 
     @classmethod
     def handle_donations(cls):
-        donations = Donation.objects.filter(
-            active=True, expires__lte=timezone.now() + timedelta(days=3)
-        ).exclude(payment=None)
+        donations = (
+            Donation.objects.filter(
+                active=True, expires__lte=timezone.now() + timedelta(days=3)
+            )
+            .exclude(payment=None)
+            .prefetch_payments()
+        )
         for donation in donations:
             payment = donation.payment_obj
             if not payment.recurring:
@@ -0,0 +1,61 @@
+#
+# Copyright © Michal Čihař <michal@weblate.org>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments.models import Customer
+from payments.validators import cache_vies_data
+
+
+class Command(BaseCommand):
+    help = "refreshes cached VIES data for stored VAT IDs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delay",
+            type=float,
+            default=1,
+            help="Time to wait between VIES queries (in seconds)",
+        )
+
+    def handle(self, *args, **options):
+        stats = {"valid": 0, "invalid": 0, "failed": 0}
+        vats = (
+            Customer.objects.exclude(vat__isnull=True)
+            .exclude(vat="")
+            .values_list("vat", flat=True)
+            .distinct()
+        )
+        for vat in vats:
+            data = getattr(cache_vies_data(vat, refresh=True), "vies_data", None)
+            if data is None:
+                stats["invalid"] += 1
+            elif "fault_code" in data or data.get("stale"):
+                stats["failed"] += 1
+            elif data["valid"]:
+                stats["valid"] += 1
+            else:
+                stats["invalid"] += 1
+            time.sleep(options["delay"])
+        self.stdout.write(
+            "Refreshed VAT IDs: {valid} valid, {invalid} invalid, "
+            "{failed} failed".format(**stats)
+        )
@@ -39,6 +39,49 @@ CSP_TEMPLATE = (
 )
 
 
+DOCS_MARKER = b"https://docs.weblate.org/en/"
+
+
+def get_csp_header():
+    style = ["'self'", "s.weblate.org"]
+    script = ["'self'"]
+    connect = ["'self'"]
+    image = ["'self'", "data:"]
+    font = ["'self'", "s.weblate.org"]
+    form = ["'self'", "weblate.org", "hosted.weblate.org"]
+
+    # Sentry/Raven
+    script.append("cdn.ravenjs.com")
+
+    # Matomo/Piwik
+    script.append("stats.cihar.com")
+    image.append("stats.cihar.com")
+    connect.append("stats.cihar.com")
+
+    # Hosted Weblate widget
+    image.append("hosted.weblate.org")
+
+    # Old blog entries
+    image.append("blog.cihar.com")
+
+    # The Pay
+    image.append("www.thepay.cz")
+    form.append("www.thepay.cz")
+
+    # GitHub avatars
+    image.append("*.githubusercontent.com")
+
+    return CSP_TEMPLATE.format(
+        style=" ".join(style),
+        image=" ".join(image),
+        script=" ".join(script),
+        font=" ".join(font),
+        connect=" ".join(connect),
+        form=" ".join(form),
+        report=SENTRY_URL,
+    )
+
+
 class SecurityMiddleware:
     """
     Middleware that sets various security related headers.
@@ -50,12 +93,23 @@ class SecurityMiddleware:
 
     def __init__(self, get_response=None):
         self.get_response = get_response
+        # The headers are constant, build them only once
+        self.headers = {
+            "Content-Security-Policy": get_csp_header(),
+            "Expect-CT": f"max-age=86400, enforce, report-uri={SENTRY_URL!r}",
+            "X-XSS-Protection": "1; mode=block",
+            # Opt-out from Google FLoC
+            "Permissions-Policy": "interest-cohort=()",
+        }
 
     def adjust_doc_links(self, response):
+        # Streaming responses would have to be consumed
+        if response.streaming:
+            return
         lang = get_language()
-        if lang in DOCUMENTATION_LANGUAGES:
+        if lang in DOCUMENTATION_LANGUAGES and DOCS_MARKER in response.content:
             response.content = response.content.replace(
-                b"https://docs.weblate.org/en/",
+                DOCS_MARKER,
                 f"https://docs.weblate.org/{DOCUMENTATION_LANGUAGES[lang]}/".encode(),
             )
 
@@ -66,51 +120,12 @@ class SecurityMiddleware:
             request._dont_enforce_csrf_checks = True
 
         response = self.get_response(request)
-        if response["Content-Type"] == "text/html; charset=utf-8":
+        if response.get("Content-Type") == "text/html; charset=utf-8":
             self.adjust_doc_links(response)
         # No CSP for debug mode (to allow djdt or error pages)
         if settings.DEBUG:
             return response
 
-        style = ["'self'", "s.weblate.org"]
-        script = ["'self'"]
-        connect = ["'self'"]
-        image = ["'self'", "data:"]
-        font = ["'self'", "s.weblate.org"]
-        form = ["'self'", "weblate.org", "hosted.weblate.org"]
-
-        # Sentry/Raven
-        script.append("cdn.ravenjs.com")
-
-        # Matomo/Piwik
-        script.append("stats.cihar.com")
-        image.append("stats.cihar.com")
-        connect.append("stats.cihar.com")
-
-        # Hosted Weblate widget
-        image.append("hosted.weblate.org")
-
-        # Old blog entries
-        image.append("blog.cihar.com")
-
-        # The Pay
-        image.append("www.thepay.cz")
-        form.append("www.thepay.cz")
-
-        # GitHub avatars
-        image.append("*.githubusercontent.com")
-
-        response["Content-Security-Policy"] = CSP_TEMPLATE.format(
-            style=" ".join(style),
-            image=" ".join(image),
-            script=" ".join(script),
-            font=" ".join(font),
-            connect=" ".join(connect),
-            form=" ".join(form),
-            report=SENTRY_URL,
-        )
-        response["Expect-CT"] = f"max-age=86400, enforce, report-uri={SENTRY_URL!r}"
-        response["X-XSS-Protection"] = "1; mode=block"
-        # Opt-out from Google FLoC
-        response["Permissions-Policy"] = "interest-cohort=()"
+        for header, value in self.headers.items():
+            response[header] = value
         return response
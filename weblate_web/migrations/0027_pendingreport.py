@@ -0,0 +1,50 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        (
+            "weblate_web",
+            "0026_package_limit_hosted_strings_report_hosted_strings_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingReport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("support", "Support"), ("hosted", "Hosted")],
+                        max_length=20,
+                    ),
+                ),
+                ("payload", models.JSONField()),
+                ("created", models.DateTimeField(auto_now_add=True)),
+                (
+                    "service",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="weblate_web.service",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Pending report",
+                "verbose_name_plural": "Pending reports",
+            },
+        ),
+    ]
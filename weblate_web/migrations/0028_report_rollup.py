@@ -0,0 +1,86 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_latest_report(apps, schema_editor):
+    Service = apps.get_model("weblate_web", "Service")
+    Report = apps.get_model("weblate_web", "Report")
+    db_alias = schema_editor.connection.alias
+    Service.objects.using(db_alias).update(
+        latest_report=Subquery(
+            Report.objects.using(db_alias)
+            .filter(service=OuterRef("pk"))
+            .order_by("-timestamp")
+            .values("pk")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("weblate_web", "0027_pendingreport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="service",
+            name="latest_report",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="weblate_web.report",
+            ),
+        ),
+        migrations.CreateModel(
+            name="ReportRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("day", "Day"), ("month", "Month")], max_length=10
+                    ),
+                ),
+                ("start", models.DateField()),
+                ("reports", models.IntegerField(default=0)),
+                ("users", models.IntegerField(default=0)),
+                ("projects", models.IntegerField(default=0)),
+                ("components", models.IntegerField(default=0)),
+                ("languages", models.IntegerField(default=0)),
+                ("source_strings", models.IntegerField(default=0)),
+                ("hosted_strings", models.IntegerField(default=0)),
+                ("hosted_words", models.IntegerField(default=0)),
+                (
+                    "service",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="weblate_web.service",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Weblate report rollup",
+                "verbose_name_plural": "Weblate report rollups",
+                "unique_together": {("service", "period", "start")},
+            },
+        ),
+        migrations.RunPython(
+            code=fill_latest_report,
+            reverse_code=migrations.RunPython.noop,
+            elidable=True,
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-17 19:40
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE weblate_web_project_fts USING fts5(name)"
+        )
+        schema_editor.execute(
+            "INSERT INTO weblate_web_project_fts(rowid, name) "
+            "SELECT id, name FROM weblate_web_project"
+        )
+    elif vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX weblate_web_project_name_tsvector "
+            "ON weblate_web_project USING GIN (to_tsvector('simple', name))"
+        )
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute("DROP TABLE weblate_web_project_fts")
+    elif vendor == "postgresql":
+        schema_editor.execute("DROP INDEX weblate_web_project_name_tsvector")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("weblate_web", "0028_report_rollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(code=create_index, reverse_code=drop_index),
+    ]
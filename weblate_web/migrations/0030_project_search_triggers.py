@@ -0,0 +1,52 @@
+# Generated by Django 5.0.6 on 2026-10-17 20:10
+
+from django.db import migrations
+
+TRIGGERS = {
+    "weblate_web_project_fts_insert": (
+        "AFTER INSERT ON weblate_web_project BEGIN "
+        "INSERT INTO weblate_web_project_fts(rowid, name) VALUES (new.id, new.name); "
+        "END"
+    ),
+    "weblate_web_project_fts_delete": (
+        "AFTER DELETE ON weblate_web_project BEGIN "
+        "DELETE FROM weblate_web_project_fts WHERE rowid = old.id; "
+        "END"
+    ),
+    "weblate_web_project_fts_update": (
+        "AFTER UPDATE ON weblate_web_project BEGIN "
+        "DELETE FROM weblate_web_project_fts WHERE rowid = old.id; "
+        "INSERT INTO weblate_web_project_fts(rowid, name) VALUES (new.id, new.name); "
+        "END"
+    ),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name, definition in TRIGGERS.items():
+        schema_editor.execute(f"CREATE TRIGGER {name} {definition}")
+    # Drop rows of projects deleted before the triggers existed
+    schema_editor.execute("DELETE FROM weblate_web_project_fts")
+    schema_editor.execute(
+        "INSERT INTO weblate_web_project_fts(rowid, name) "
+        "SELECT id, name FROM weblate_web_project"
+    )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f"DROP TRIGGER {name}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("weblate_web", "0029_project_search_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(code=create_triggers, reverse_code=drop_triggers),
+    ]
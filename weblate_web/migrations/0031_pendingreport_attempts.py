@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-17 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("weblate_web", "0030_project_search_triggers"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pendingreport",
+            name="attempts",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="pendingreport",
+            name="error",
+            field=models.TextField(blank=True),
+        ),
+    ]
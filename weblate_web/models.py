@@ -17,20 +17,42 @@
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
 
+import json
+import logging
+import random
 import sys
+import time
+from collections import defaultdict
 from datetime import timedelta
 from io import BytesIO
+from typing import NamedTuple
 from uuid import uuid4
 
 import html2text
 import PIL
 import requests
+import sentry_sdk
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import FileExtensionValidator
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import (
+    Count,
+    F,
+    Max,
+    Min,
+    Prefetch,
+    Q,
+    Subquery,
+    Sum,
+    Window,
+)
+from django.db.models.functions import RowNumber, TruncDate, TruncMonth
+from django.db.models.query import ModelIterable
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
@@ -42,11 +64,17 @@ from paramiko.client import SSHClient
 
 from payments.models import Char32UUIDField, Payment, get_period_delta
 from payments.utils import send_notification
+from weblate_web.remote import CACHE_TIMEOUT, get_activity, on_refresh
+from weblate_web.search import get_search_backend
+
+LOGGER = logging.getLogger(__name__)
 
 ALLOWED_IMAGES = {"image/jpeg", "image/png"}
 
 PAYMENTS_ORIGIN = "https://weblate.org/donate/process/"
 SUBACCOUNTS_API = "https://robot-ws.your-server.de/storagebox/{}/subaccount"
+FOOTER_KEY = "wlweb-footer"
+DISCOVER_KEY = "wlweb-discover"
 
 REWARDS = (
     (0, gettext_lazy("No reward")),
@@ -81,6 +109,48 @@ HOSTED_UPGRADES = {
 
 TOPIC_DICT = dict(TOPICS)
 
+# Support tiers in the order of precedence
+SERVICE_TIERS = ("hosted", "shared", "premium", "extended", "basic")
+SERVICE_LIMITS = (
+    "limit_source_strings",
+    "limit_hosted_words",
+    "limit_hosted_strings",
+    "limit_languages",
+    "limit_projects",
+)
+
+
+class ServiceStatus(NamedTuple):
+    status: str
+    package: str
+    backup: bool
+
+
+def get_subscription_status(subscriptions) -> ServiceStatus:
+    """
+    Compute service status from active subscriptions.
+
+    The subscriptions are (package, expires) pairs. Hosted and shared tiers use
+    limits from the latest expiring package, other tiers use community limits.
+    """
+    latest = {}
+    backup = False
+    for package, expires in subscriptions:
+        if package == "backup":
+            backup = True
+            continue
+        tier = package.split(":", 1)[0] if ":" in package else package
+        if tier not in SERVICE_TIERS:
+            continue
+        if tier not in latest or latest[tier][1] < expires:
+            latest[tier] = (package, expires)
+
+    for tier in SERVICE_TIERS:
+        if tier in latest:
+            package = latest[tier][0] if tier in {"hosted", "shared"} else "community"
+            return ServiceStatus(tier, package, backup or tier == "hosted")
+    return ServiceStatus("community", "community", backup)
+
 
 def validate_bitmap(value):
     """
@@ -140,19 +210,6 @@ def validate_bitmap(value):
         image.close()
 
 
-class MySQLSearchLookup(models.Lookup):
-    lookup_name = "search"
-
-    def as_sql(self, compiler, connection):
-        lhs, lhs_params = self.process_lhs(compiler, connection)
-        rhs, rhs_params = self.process_rhs(compiler, connection)
-        params = lhs_params + rhs_params
-        return f"MATCH ({lhs}) AGAINST ({rhs} IN NATURAL LANGUAGE MODE)", params
-
-
-models.CharField.register_lookup(MySQLSearchLookup)
-
-
 def create_backup_repository(service):
     """
     Configure backup repository.
@@ -193,6 +250,61 @@ def create_backup_repository(service):
     )
 
 
+def prefetch_payments(objects, *related: str, chunk_size: int = 1000):
+    """
+    Populate payment_obj for objects referencing payments.
+
+    The payments live in a different database, so this can not use
+    prefetch_related. Instead all referenced payments are fetched in one query
+    per chunk, optionally with related objects such as the customer.
+    """
+    pending = {}
+    for obj in objects:
+        if obj.payment:
+            pending.setdefault(obj.payment, []).append(obj)
+    references = list(pending)
+    for offset in range(0, len(references), chunk_size):
+        payments = Payment.objects.filter(
+            pk__in=references[offset : offset + chunk_size]
+        ).order_by()
+        if related:
+            payments = payments.select_related(*related)
+        for payment in payments:
+            for obj in pending[payment.pk]:
+                # Store the value for the cached_property
+                obj.__dict__["payment_obj"] = payment
+    return objects
+
+
+class PaymentRefQuerySet(models.QuerySet):
+    """Queryset for models referencing payments."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetch_payments = None
+
+    def prefetch_payments(self, *related: str):
+        """Fetch referenced payments, similar to prefetch_related."""
+        clone = self._chain()
+        clone._prefetch_payments = related
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._prefetch_payments = self._prefetch_payments
+        return clone
+
+    def _fetch_all(self):
+        fetched = self._result_cache is None
+        super()._fetch_all()
+        if (
+            fetched
+            and self._prefetch_payments is not None
+            and issubclass(self._iterable_class, ModelIterable)
+        ):
+            prefetch_payments(self._result_cache, *self._prefetch_payments)
+
+
 class Donation(models.Model):
     user = models.ForeignKey(User, on_delete=models.deletion.CASCADE)
     payment = Char32UUIDField(blank=True, null=True)
@@ -208,6 +320,8 @@ class Donation(models.Model):
     expires = models.DateTimeField()
     active = models.BooleanField(blank=True, db_index=True)
 
+    objects = PaymentRefQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Donation"
         verbose_name_plural = "Donations"
@@ -252,6 +366,41 @@ class Donation(models.Model):
         )
 
 
+def update_footer(activity=None):
+    """Materialize donor links and activity sum shown on the pages."""
+    if activity is None:
+        activity = get_activity()
+    result = {
+        "donate_links": [
+            {
+                "link_text": donation.link_text,
+                "link_url": donation.link_url,
+                "link_image": donation.link_image.url if donation.link_image else "",
+            }
+            for donation in Donation.objects.filter(active=True, reward=3)
+        ],
+        "activity_sum": sum(activity[-7:]),
+    }
+    cache.set(FOOTER_KEY, result, timeout=CACHE_TIMEOUT)
+    return result
+
+
+on_refresh("wlweb-activity-stats")(update_footer)
+
+
+def get_footer():
+    result = cache.get(FOOTER_KEY)
+    if result is None:
+        result = update_footer()
+    return result
+
+
+@receiver(post_save, sender=Donation)
+@receiver(post_delete, sender=Donation)
+def donation_changed(sender, **kwargs):
+    transaction.on_commit(update_footer)
+
+
 def process_donation(payment):
     if payment.state != Payment.ACCEPTED:
         raise ValueError("Cannot process non-accepted payment")
@@ -517,6 +666,15 @@ class Service(models.Model):
             validate_bitmap,
         ],
     )
+    # Denormalized pointer to the most recent report
+    latest_report = models.ForeignKey(
+        "Report",
+        on_delete=models.deletion.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        editable=False,
+    )
 
     class Meta:
         verbose_name = "Customer service"
@@ -591,14 +749,14 @@ class Service(models.Model):
 
     @cached_property
     def user_emails(self):
-        return ", ".join(self.users.values_list("email", flat=True))
+        # Uses prefetched users when available
+        return ", ".join(user.email for user in self.users.all())
 
     @cached_property
     def last_report(self):
-        try:
-            return self.report_set.latest("timestamp")
-        except Report.DoesNotExist:
+        if self.latest_report_id is None:
             return None
+        return self.latest_report
 
     @cached_property
     def hosted_subscriptions(self):
@@ -710,44 +868,34 @@ class Service(models.Model):
 
         return result
 
-    def update_status(self):
-        status = "community"
-        package = "community"
-        if self.hosted_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "hosted"
-            package = self.hosted_subscriptions.latest("expires").package
-        elif self.shared_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "shared"
-            package = self.shared_subscriptions.latest("expires").package
-        elif self.premium_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "premium"
-        elif self.extended_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "extended"
-        elif self.basic_subscriptions.filter(expires__gt=timezone.now()).exists():
-            status = "basic"
-        package_obj = Package.objects.get(name=package)
+    def get_status(self) -> ServiceStatus:
+        return get_subscription_status(
+            self.subscription_set.filter(expires__gt=timezone.now()).values_list(
+                "package", "expires"
+            )
+        )
 
-        if (
-            status != self.status
-            or package_obj.limit_source_strings != self.limit_source_strings
-            or package_obj.limit_hosted_words != self.limit_hosted_words
-            or package_obj.limit_hosted_strings != self.limit_hosted_strings
-        ):
-            self.status = status
-            self.limit_source_strings = package_obj.limit_source_strings
-            self.limit_hosted_words = package_obj.limit_hosted_words
-            self.limit_hosted_strings = package_obj.limit_hosted_strings
-            self.limit_languages = package_obj.limit_languages
-            self.limit_projects = package_obj.limit_projects
+    def apply_status(self, status: ServiceStatus, package: Package) -> bool:
+        """Update status and limits from the package, returns whether changed."""
+        changed = status.status != self.status
+        self.status = status.status
+        for limit in SERVICE_LIMITS:
+            value = getattr(package, limit)
+            if value != getattr(self, limit):
+                setattr(self, limit, value)
+                changed = True
+        return changed
+
+    def update_status(self) -> ServiceStatus:
+        status = self.get_status()
+        if self.apply_status(status, Package.objects.get(name=status.package)):
             self.save()
+        return status
 
-    def create_backup(self):
-        backup = False
-        if self.hosted_subscriptions.filter(expires__gt=timezone.now()).exists():
-            backup = True
-        if self.backup_subscriptions.filter(expires__gt=timezone.now()).exists():
-            backup = True
-        if backup and not self.backup_repository and self.report_set.exists():
+    def create_backup(self, status=None):
+        if status is None:
+            status = self.get_status()
+        if status.backup and not self.backup_repository and self.report_set.exists():
             self.backup_repository = create_backup_repository(self)
             self.save(update_fields=["backup_repository"])
 
@@ -786,6 +934,47 @@ class Service(models.Model):
         self.secret = generate_secret()
         self.save(update_fields=["secret"])
 
+    def sync_projects(self, projects: list[dict]) -> dict:
+        """
+        Synchronize public projects with the reported ones.
+
+        The difference is applied using bulk operations, so the number of queries
+        does not depend on the number of projects.
+        """
+        start = time.monotonic()
+        reported = {}
+        for project in projects:
+            # Skip unexpected data
+            if set(project) != {"name", "web", "url"}:
+                continue
+            if len(reported) >= settings.PUBLIC_PROJECTS_LIMIT:
+                break
+            reported[(project["name"], project["url"], project["web"])] = project
+
+        with transaction.atomic():
+            current = {
+                (name, url, web): pk
+                for pk, name, url, web in self.project_set.values_list(
+                    "pk", "name", "url", "web"
+                )
+            }
+            stale = [pk for item, pk in current.items() if item not in reported]
+            new = [
+                Project(service=self, **project)
+                for item, project in reported.items()
+                if item not in current
+            ]
+            if stale:
+                Project.objects.filter(pk__in=stale).delete()
+            if new:
+                Project.objects.bulk_create(new, batch_size=500)
+
+        return {
+            "created": len(new),
+            "deleted": len(stale),
+            "duration": time.monotonic() - start,
+        }
+
 
 class Subscription(models.Model):
     service = models.ForeignKey(Service, on_delete=models.deletion.CASCADE)
@@ -795,6 +984,8 @@ class Subscription(models.Model):
     expires = models.DateTimeField()
     enabled = models.BooleanField(default=True, blank=True)
 
+    objects = PaymentRefQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Customer’s subscription"
         verbose_name_plural = "Customer’s subscriptions"
@@ -871,6 +1062,70 @@ class Subscription(models.Model):
         )
 
 
+def prefetch_packages(subscriptions):
+    """Populate package_obj for subscriptions using a single query."""
+    packages = {package.name: package for package in Package.objects.all()}
+    for subscription in subscriptions:
+        if subscription.package in packages:
+            subscription.__dict__["package_obj"] = packages[subscription.package]
+    return subscriptions
+
+
+def get_obsolete_subscriptions(subscriptions) -> set[int]:
+    """
+    Return subscriptions which could be obsolete.
+
+    This is bulk variant of Subscription.could_be_obsolete, the other support
+    subscriptions of the services are fetched in a single query.
+    """
+    candidates = [
+        subscription
+        for subscription in subscriptions
+        if subscription.package in {"basic", "extended", "premium"}
+    ]
+    if not candidates:
+        return set()
+    renewed = defaultdict(set)
+    for service_id, pk in Subscription.objects.filter(
+        Q(package__startswith="hosted:")
+        | Q(package__startswith="shared:")
+        | Q(package__in={"basic", "extended", "premium"}),
+        service__in={subscription.service_id for subscription in candidates},
+        expires__gt=timezone.now() + timedelta(days=3),
+    ).values_list("service_id", "pk"):
+        renewed[service_id].add(pk)
+    return {
+        subscription.pk
+        for subscription in candidates
+        if renewed[subscription.service_id] - {subscription.pk}
+    }
+
+
+def update_services_status(services=None) -> list[Service]:
+    """
+    Recompute status of many services at once.
+
+    Active subscriptions and packages are fetched using a single query each and
+    only changed services are written back. Returns the changed services.
+    """
+    if services is None:
+        services = Service.objects.all()
+    subscriptions = defaultdict(list)
+    for service_id, package, expires in Subscription.objects.filter(
+        service__in=services, expires__gt=timezone.now()
+    ).values_list("service_id", "package", "expires"):
+        subscriptions[service_id].append((package, expires))
+    packages = {package.name: package for package in Package.objects.all()}
+
+    changed = []
+    for service in services:
+        status = get_subscription_status(subscriptions[service.pk])
+        if service.apply_status(status, packages[status.package]):
+            changed.append(service)
+    Service.objects.bulk_update(changed, ["status", *SERVICE_LIMITS], batch_size=500)
+    return changed
+
+
 class PastPayments(models.Model):
     subscription = models.ForeignKey(
         Subscription, on_delete=models.deletion.CASCADE, null=True, blank=True
@@ -880,6 +1135,8 @@ class PastPayments(models.Model):
     )
     payment = Char32UUIDField()
 
+    objects = PaymentRefQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Past payment"
         verbose_name_plural = "Past payments"
@@ -887,6 +1144,10 @@ class PastPayments(models.Model):
     def __str__(self):
         return f"{self.subscription}: {self.payment}"
 
+    @cached_property
+    def payment_obj(self):
+        return Payment.objects.get(pk=self.payment)
+
 
 class Report(models.Model):
     service = models.ForeignKey(Service, on_delete=models.deletion.CASCADE)
@@ -915,12 +1176,23 @@ class Report(models.Model):
         self, force_insert=False, force_update=False, using=None, update_fields=None
     ):
         super().save(force_insert, force_update, using, update_fields)
+        if (
+            Report.objects.filter(service_id=self.service_id)
+            .filter(
+                Q(timestamp__gt=self.timestamp)
+                | Q(timestamp=self.timestamp, pk__gt=self.pk)
+            )
+            .exists()
+        ):
+            # Service details come from the latest report
+            return
         self.service.discoverable = self.discoverable
         self.service.site_url = self.site_url
         self.service.site_title = self.site_title
         self.service.site_version = self.version
         self.service.site_users = self.users
         self.service.site_projects = self.projects
+        self.service.latest_report = self
         self.service.save(
             update_fields=[
                 "discoverable",
@@ -929,8 +1201,159 @@ class Report(models.Model):
                 "site_version",
                 "site_users",
                 "site_projects",
+                "latest_report",
             ]
         )
+        self.service.__dict__.pop("last_report", None)
+
+
+@receiver(post_delete, sender=Report)
+def report_deleted(sender, instance, **kwargs):
+    # The latest report pointer was cleared, point it to the previous report
+    Service.objects.filter(pk=instance.service_id, latest_report=None).update(
+        latest_report=Subquery(
+            Report.objects.filter(service_id=instance.service_id)
+            .order_by("-timestamp", "-pk")
+            .values("pk")[:1]
+        )
+    )
+
+
+class ReportRollup(models.Model):
+    DAY = "day"
+    MONTH = "month"
+
+    service = models.ForeignKey(Service, on_delete=models.deletion.CASCADE)
+    period = models.CharField(max_length=10, choices=((DAY, "Day"), (MONTH, "Month")))
+    start = models.DateField()
+    reports = models.IntegerField(default=0)
+    users = models.IntegerField(default=0)
+    projects = models.IntegerField(default=0)
+    components = models.IntegerField(default=0)
+    languages = models.IntegerField(default=0)
+    source_strings = models.IntegerField(default=0)
+    hosted_strings = models.IntegerField(default=0)
+    hosted_words = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Weblate report rollup"
+        verbose_name_plural = "Weblate report rollups"
+        unique_together = [("service", "period", "start")]
+
+    def __str__(self):
+        return f"{self.service_id}: {self.period} {self.start}"
+
+
+# Report values kept as maximum within the rollup period
+ROLLUP_FIELDS = (
+    "users",
+    "projects",
+    "components",
+    "languages",
+    "source_strings",
+    "hosted_strings",
+    "hosted_words",
+)
+
+
+def merge_rollups(period: str, rows) -> int:
+    """
+    Merge aggregated rows into existing rollups of the period.
+
+    Rows contain service_id, period_start, total and maximum of each
+    ROLLUP_FIELDS value suffixed by _max.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    existing = {
+        (rollup.service_id, rollup.start): rollup
+        for rollup in ReportRollup.objects.filter(
+            period=period,
+            service_id__in={row["service_id"] for row in rows},
+            start__in={row["period_start"] for row in rows},
+        )
+    }
+    created = []
+    updated = []
+    for row in rows:
+        rollup = existing.get((row["service_id"], row["period_start"]))
+        if rollup is None:
+            created.append(
+                ReportRollup(
+                    service_id=row["service_id"],
+                    period=period,
+                    start=row["period_start"],
+                    reports=row["total"],
+                    **{field: row[f"{field}_max"] for field in ROLLUP_FIELDS},
+                )
+            )
+            continue
+        rollup.reports += row["total"]
+        for field in ROLLUP_FIELDS:
+            setattr(rollup, field, max(getattr(rollup, field), row[f"{field}_max"]))
+        updated.append(rollup)
+    ReportRollup.objects.bulk_create(created)
+    ReportRollup.objects.bulk_update(updated, ["reports", *ROLLUP_FIELDS])
+    return len(rows)
+
+
+def compact_reports(chunk_size: int = 1000) -> dict[str, int]:
+    """
+    Roll old reports into daily and monthly aggregates.
+
+    Reports older than REPORTS_RETENTION_DAYS are merged into daily rollups,
+    and daily rollups older than REPORTS_DAILY_RETENTION_DAYS into monthly ones.
+    Latest report of each service is always kept. Work is done in chunks, each
+    in its own transaction.
+    """
+    now = timezone.now()
+    result = {"reports": 0, "days": 0}
+
+    reports = (
+        Report.objects.filter(
+            timestamp__lt=now - timedelta(days=settings.REPORTS_RETENTION_DAYS)
+        )
+        .exclude(
+            pk__in=Service.objects.filter(latest_report__isnull=False).values(
+                "latest_report"
+            )
+        )
+        .order_by("pk")
+    )
+    while chunk := list(reports.values_list("pk", flat=True)[:chunk_size]):
+        with transaction.atomic():
+            merge_rollups(
+                ReportRollup.DAY,
+                Report.objects.filter(pk__in=chunk)
+                .values("service_id", period_start=TruncDate("timestamp"))
+                .annotate(
+                    total=Count("pk"),
+                    **{f"{field}_max": Max(field) for field in ROLLUP_FIELDS},
+                ),
+            )
+            Report.objects.filter(pk__in=chunk).delete()
+        result["reports"] += len(chunk)
+
+    days = ReportRollup.objects.filter(
+        period=ReportRollup.DAY,
+        start__lt=(now - timedelta(days=settings.REPORTS_DAILY_RETENTION_DAYS)).date(),
+    ).order_by("pk")
+    while chunk := list(days.values_list("pk", flat=True)[:chunk_size]):
+        with transaction.atomic():
+            merge_rollups(
+                ReportRollup.MONTH,
+                ReportRollup.objects.filter(pk__in=chunk)
+                .values("service_id", period_start=TruncMonth("start"))
+                .annotate(
+                    total=Sum("reports"),
+                    **{f"{field}_max": Max(field) for field in ROLLUP_FIELDS},
+                ),
+            )
+            ReportRollup.objects.filter(pk__in=chunk).delete()
+        result["days"] += len(chunk)
+
+    return result
 
 
 class Project(models.Model):
@@ -946,3 +1369,272 @@ class Project(models.Model):
 
     def __str__(self):
         return f"{self.service.site_title}: {self.name}"
+
+
+def get_discover_entry(service, projects, matched=None) -> dict:
+    """
+    Return discover listing data for the service.
+
+    The matched count includes matching projects which are not shown.
+    """
+    if matched is None:
+        matched = len(projects)
+    return {
+        "pk": service.pk,
+        "site_url": service.site_url,
+        "site_title": service.site_title,
+        "site_users": service.site_users,
+        "site_projects": service.site_projects,
+        "discover_text": service.discover_text,
+        "discover_image": service.discover_image.url if service.discover_image else "",
+        "matched_projects": [
+            {"name": project.name, "url": project.url} for project in projects
+        ],
+        "non_matched_projects_count": max(service.site_projects - matched, 0),
+    }
+
+
+def update_discover() -> list[dict]:
+    """
+    Materialize discover listing.
+
+    Each refresh picks a new sample of projects for services with many of them.
+    """
+    services = (
+        Service.objects.filter(discoverable=True)
+        .order_by("pk")
+        .prefetch_related(
+            Prefetch(
+                "project_set",
+                queryset=Project.objects.only("service_id", "name", "url"),
+            )
+        )
+    )
+    result = []
+    for service in services:
+        projects = list(service.project_set.all())
+        if len(projects) > settings.DISCOVER_PROJECTS:
+            projects = random.sample(projects, settings.DISCOVER_PROJECTS)
+        result.append(get_discover_entry(service, projects))
+    cache.set(DISCOVER_KEY, result, timeout=None)
+    return result
+
+
+def get_discover() -> list[dict]:
+    result = cache.get(DISCOVER_KEY)
+    if result is None:
+        result = update_discover()
+    return result
+
+
+def get_discover_page(after: int = 0) -> tuple:
+    """
+    Return a page of the discover listing and a cursor for the next one.
+
+    The cursor is the primary key of the last service on the page.
+    """
+    services = [entry for entry in get_discover() if entry["pk"] > after]
+    if len(services) > settings.DISCOVER_PAGE_SIZE:
+        services = services[: settings.DISCOVER_PAGE_SIZE]
+        return services, services[-1]["pk"]
+    return services, None
+
+
+def parse_discover_cursor(cursor: str):
+    """Parse search cursor, invalid cursors start from the beginning."""
+    try:
+        score, pk = json.loads(cursor)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(score, (int, float, str)) or not isinstance(pk, int):
+        return None
+    return score, pk
+
+
+def search_discover(query: str, after: str = "") -> tuple:
+    """
+    Return a page of services with projects matching the query.
+
+    Services are ordered by the score of their best matching project, the
+    cursor is the score and primary key of the last service on the page. Only
+    DISCOVER_PROJECTS best matching projects are fetched for each service.
+    """
+    search = get_search_backend()
+    matching = search.ranked(Project.objects.filter(service__discoverable=True), query)
+    scores = (
+        matching.order_by()
+        .values("service_id")
+        .annotate(score=Min(search.score(query)), matched=Count("pk"))
+        .order_by("score", "service_id")
+    )
+    cursor = parse_discover_cursor(after)
+    if cursor is not None:
+        scores = scores.filter(
+            Q(score__gt=cursor[0]) | Q(score=cursor[0], service_id__gt=cursor[1])
+        )
+    ranked = list(scores[: settings.DISCOVER_PAGE_SIZE + 1])
+    cursor = None
+    if len(ranked) > settings.DISCOVER_PAGE_SIZE:
+        ranked = ranked[: settings.DISCOVER_PAGE_SIZE]
+        cursor = json.dumps([ranked[-1]["score"], ranked[-1]["service_id"]])
+    if not ranked:
+        return [], cursor
+
+    pks = [item["service_id"] for item in ranked]
+    services = Service.objects.in_bulk(pks)
+    projects = defaultdict(list)
+    for project in (
+        matching.filter(service__in=pks)
+        .annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F("service_id"),
+                order_by=search.ordering(query),
+            )
+        )
+        .filter(position__lte=settings.DISCOVER_PROJECTS)
+    ):
+        projects[project.service_id].append(project)
+
+    return [
+        get_discover_entry(
+            services[item["service_id"]],
+            projects[item["service_id"]],
+            item["matched"],
+        )
+        for item in ranked
+    ], cursor
+
+
+def invalidate_discover():
+    """Mark discover listing as outdated, it is rebuilt by refresh_discover."""
+    cache.set(f"{DISCOVER_KEY}-stale", True, timeout=None)
+
+
+def refresh_discover() -> bool:
+    """Rebuild discover listing if it was invalidated."""
+    if cache.delete(f"{DISCOVER_KEY}-stale"):
+        update_discover()
+        return True
+    return False
+
+
+class PendingReport(models.Model):
+    SUPPORT = "support"
+    HOSTED = "hosted"
+
+    service = models.ForeignKey(Service, on_delete=models.deletion.CASCADE)
+    kind = models.CharField(
+        max_length=20, choices=((SUPPORT, "Support"), (HOSTED, "Hosted"))
+    )
+    payload = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Pending report"
+        verbose_name_plural = "Pending reports"
+
+    def __str__(self):
+        return f"{self.kind}: {self.service}"
+
+
+def process_support_report(service, payload):
+    was_discoverable = service.discoverable
+    service.report_set.create(**payload["report"])
+    status = service.update_status()
+    # Backup repository is created using remote services, do not hold the
+    # transaction for it; it is retried with the next report on failure
+    transaction.on_commit(lambda: service.create_backup(status), robust=True)
+    if "public_projects" in payload:
+        stats = service.sync_projects(payload["public_projects"])
+        LOGGER.info(
+            "synchronized projects for service %s: %d created, %d deleted in %.2fs",
+            service.pk,
+            stats["created"],
+            stats["deleted"],
+            stats["duration"],
+        )
+    if service.discoverable or was_discoverable:
+        invalidate_discover()
+
+
+def process_hosted_report(service, payload):
+    # TODO: This is temporary hack for payments migration period
+    payments = list(
+        Payment.objects.filter(billing=payload["billing"])
+        .order_by("end")
+        .values_list("pk", flat=True)
+    )
+    if payments:
+        # Create/update subscription
+        subscription = Subscription.objects.get_or_create(
+            service=service,
+            package=payload["package"],
+            defaults={"payment": payments[-1]},
+        )[0]
+        if subscription.payment != payments[-1]:
+            subscription.payment = payments[-1]
+            subscription.save(update_fields=["payment"])
+        # Link past payments
+        for payment in payments[:-1]:
+            subscription.pastpayments_set.get_or_create(payment=payment)
+
+    # Link users which are supposed to have access
+    for user in payload["users"]:
+        service.users.add(User.objects.get_or_create(username=user)[0])
+
+    # Collect stats
+    service.report_set.create(**payload["report"])
+    service.update_status()
+
+
+REPORT_PROCESSORS = {
+    PendingReport.SUPPORT: process_support_report,
+    PendingReport.HOSTED: process_hosted_report,
+}
+
+
+def process_pending_report(pk: int) -> bool:
+    """
+    Process a single queued report.
+
+    The report is claimed by deleting it within the processing transaction, so
+    concurrent workers never process the same report. Failed reports stay
+    queued until they fail REPORTS_RETRIES times.
+    """
+    report = None
+    try:
+        with transaction.atomic():
+            report = PendingReport.objects.select_related("service").get(pk=pk)
+            if not PendingReport.objects.filter(pk=pk).delete()[0]:
+                # Claimed by other worker
+                return False
+            REPORT_PROCESSORS[report.kind](report.service, report.payload)
+    except PendingReport.DoesNotExist:
+        return False
+    except Exception as error:
+        sentry_sdk.capture_exception(error)
+        if report is None:
+            return False
+        if report.attempts + 1 >= settings.REPORTS_RETRIES:
+            LOGGER.exception(
+                "dropping %s report for service %s after %d attempts",
+                report.kind,
+                report.service_id,
+                report.attempts + 1,
+            )
+            PendingReport.objects.filter(pk=pk).delete()
+        else:
+            PendingReport.objects.filter(pk=pk).update(
+                attempts=F("attempts") + 1, error=str(error)
+            )
+        return False
+    return True
+
+
+def process_pending_reports(limit=None) -> int:
+    """Process queued reports in the order they were received."""
+    pending = PendingReport.objects.order_by("pk").values_list("pk", flat=True)
+    return sum(process_pending_report(pk) for pk in pending[:limit])
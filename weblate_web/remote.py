@@ -16,15 +16,32 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 #
-"""Remote data fetching and caching."""
+"""
+Remote data fetching and caching.
+
+The data is served stale-while-revalidate: the last known value is always
+returned immediately and refreshed in the background once it is older than
+REFRESH_TIMEOUT. Only one worker refreshes at a time, and failed fetches
+never replace previously fetched data.
+"""
 
 from __future__ import annotations
 
+import gzip
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ijson
 import requests
 import sentry_sdk
 from dateutil.parser import parse
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connections
+from django.template.loader import render_to_string
 from wlc import Weblate, WeblateException
 
 CONTRIBUTORS_URL = "https://api.github.com/repos/{}/{}/stats/contributors"
@@ -32,25 +49,191 @@ PYPI_URL = "https://pypi.org/pypi/weblate/json"
 WEBLATE_CONTRIBUTORS_URL = CONTRIBUTORS_URL.format("WeblateOrg", "weblate")
 EXCLUDE_USERS = {"nijel", "weblate"}
 ACTIVITY_URL = "https://hosted.weblate.org/activity/month.json"
+ACTIVITY_SVG_KEY = "wlweb-activity-svg"
+CHANGES_PROJECTS_KEY = "wlweb-changes-projects"
+# Maximal age of project statistics reused in incremental mode
+CHANGES_MAX_AGE = 24 * 3600
+# Hard TTL, data is dropped from the cache after this
 CACHE_TIMEOUT = 72 * 3600
+# Soft TTL, data is refreshed in the background after this
+REFRESH_TIMEOUT = 6 * 3600
+# Upper bound for a single refresh holding the lock
+LOCK_TIMEOUT = 120
+REQUEST_TIMEOUT = 10
 
+# Callbacks invoked with the data whenever new data is stored for the key
+REFRESH_HOOKS: dict[str, list] = {}
 
-def get_contributors(force: bool = False):
-    key = "wlweb-contributors"
+
+def on_refresh(key: str):
+    def register(func):
+        REFRESH_HOOKS.setdefault(key, []).append(func)
+        return func
+
+    return register
+
+
+def set_meta(key: str, validators: dict | None = None):
+    cache.set(
+        f"{key}-meta",
+        {"timestamp": time.time(), "validators": validators or {}},
+        timeout=CACHE_TIMEOUT,
+    )
+
+
+def set_cached(key: str, data, validators: dict | None = None):
+    """Store fetched data together with its fetch timestamp and HTTP validators."""
+    cache.set(key, data, timeout=CACHE_TIMEOUT)
+    set_meta(key, validators)
+
+
+def is_stale(key: str) -> bool:
+    meta = cache.get(f"{key}-meta")
+    if meta is None or meta["timestamp"] + REFRESH_TIMEOUT < time.time():
+        return True
+    # The data might have been evicted from the cache
+    return not cache.has_key(key)
+
+
+def acquire_refresh(key: str) -> bool:
+    """Acquire the refresh lock for the key."""
+    return cache.add(f"{key}-lock", True, timeout=LOCK_TIMEOUT)
+
+
+def refresh_cached(
+    key: str,
+    fetcher,
+    force: bool = False,
+    stats: dict | None = None,
+    locked: bool = False,
+) -> bool:
+    """
+    Refresh cached data using fetcher.
+
+    The fetcher returns None on failure, in that case the cached data is kept.
+    Details about the fetch are collected in stats. With locked the caller
+    already holds the refresh lock, it is released here. Returns whether the
+    cache was updated.
+    """
+    if stats is None:
+        stats = {}
+    acquired = locked or acquire_refresh(key)
+    if not acquired and not force:
+        # Other worker is already refreshing this
+        return False
+    try:
+        # Revalidate only when there is cached data to fall back to
+        meta = cache.get(f"{key}-meta")
+        if meta and cache.has_key(key):
+            stats["validators"] = meta.get("validators", {})
+        data = fetcher(stats)
+        if data is None and stats.get("status") == 304:
+            # Not modified, extend lifetime of the cached data
+            if cache.touch(key, CACHE_TIMEOUT):
+                set_meta(key, stats["validators"])
+                return True
+            # The data was evicted meanwhile, fetch it again
+            del stats["validators"]
+            data = fetcher(stats)
+        if data is None:
+            return False
+        set_cached(key, data, stats.get("validators"))
+        for hook in REFRESH_HOOKS.get(key, []):
+            hook(data)
+        return True
+    finally:
+        # Do not release lock held by other worker
+        if acquired:
+            cache.delete(f"{key}-lock")
+
+
+def refresh_background(key: str, fetcher) -> bool:
+    """Refresh data in a background thread unless other worker does that."""
+    if not acquire_refresh(key):
+        return False
+
+    def run():
+        try:
+            refresh_cached(key, fetcher, locked=True)
+        except Exception as error:
+            sentry_sdk.capture_exception(error)
+        finally:
+            # Refresh hooks might use the database
+            connections.close_all()
+
+    threading.Thread(target=run, name=f"refresh-{key}", daemon=True).start()
+    return True
+
+
+def get_cached(key: str, fetcher, force: bool = False, default=None):
+    """
+    Return cached data, refreshing it as needed.
+
+    With force the data is refreshed synchronously, otherwise stale or missing
+    data is refreshed in the background and the last known value is returned.
+    """
+    if force:
+        refresh_cached(key, fetcher, force=True)
     results = cache.get(key)
-    if not force and results is not None:
-        return results
+    if not force and (results is None or is_stale(key)):
+        refresh_background(key, fetcher)
+    if results is None:
+        return default
+    return results
+
+
+def fetch_url(url: str, stats: dict, stream: bool = False):
+    """
+    Fetch the URL.
+
+    Validators from previous fetch are used for conditional request, the
+    response validators are stored back in stats. The request timeout can be
+    limited by timeout in stats. Returns None on failure or
+    when the document was not modified.
+    """
+    validators = stats.get("validators", {})
+    headers = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        headers["If-Modified-Since"] = validators["last_modified"]
     # Perform request
     try:
-        response = requests.get(WEBLATE_CONTRIBUTORS_URL, timeout=10)
+        response = requests.get(
+            url,
+            headers=headers,
+            timeout=stats.get("timeout", REQUEST_TIMEOUT),
+            stream=stream,
+        )
     except OSError as error:
         sentry_sdk.capture_exception(error)
-        response = None
-    # Stats are not yet calculated
-    if response is None or response.status_code != 200:
-        return []
+        stats["status"] = "error"
+        return None
+    stats["status"] = response.status_code
+    # Stats are not yet calculated or not modified
+    if response.status_code != 200:
+        response.close()
+        return None
+    stats["validators"] = {
+        name: response.headers[header]
+        for name, header in (("etag", "ETag"), ("last_modified", "Last-Modified"))
+        if header in response.headers
+    }
+    return response
+
+
+def fetch_json(url: str, stats: dict):
+    response = fetch_url(url, stats)
+    if response is None:
+        return None
+    stats["bytes"] = len(response.content)
+    return response.json()
+
 
-    stats = response.json()
+def fetch_contributors(fetch_stats: dict):
+    stats = fetch_json(WEBLATE_CONTRIBUTORS_URL, fetch_stats)
+    if stats is None:
+        return None
     # Fill in ranking. This seems to best reflect people effort, but still
     # is not accurate at all. The problem is that commits stats are
     # misleading due to high number of commits generated by old Weblate
@@ -65,76 +248,209 @@ def get_contributors(force: bool = False):
 
     stats.sort(key=lambda x: -x["rank"])
 
-    data = stats[:8]
-    cache.set(key, data, timeout=CACHE_TIMEOUT)
-    return data
+    return stats[:8]
+
+
+def get_contributors(force: bool = False):
+    return get_cached("wlweb-contributors", fetch_contributors, force, [])
+
+
+def fetch_activity(fetch_stats: dict):
+    stats = fetch_json(ACTIVITY_URL, fetch_stats)
+    if stats is None:
+        return None
+    return stats[-25:]
 
 
 def get_activity(force: bool = False):
-    key = "wlweb-activity-stats"
-    results = cache.get(key)
-    if not force and results is not None:
-        return results
-    # Perform request
-    try:
-        response = requests.get(ACTIVITY_URL, timeout=10)
-    except OSError as error:
-        sentry_sdk.capture_exception(error)
-        response = None
-    # Stats are not yet calculated
-    if response is None or response.status_code != 200:
+    return get_cached("wlweb-activity-stats", fetch_activity, force, [])
+
+
+def render_activity_svg(data) -> dict:
+    """Render activity SVG and store it together with its ETag and gzip variant."""
+    bars = []
+    opacities = {0: ".1", 1: ".3", 2: ".5", 3: ".7"}
+    top_count = max(data) if data else 0
+    for i, count in enumerate(data):
+        height = int(76 * count / top_count) if top_count else 0
+        item = {
+            "rx": 2,
+            "width": 6,
+            "height": height,
+            "id": f"b{i}",
+            "x": 10 * i,
+            "y": 86 - height,
+        }
+        if height < 20:
+            item["fill"] = "#f6664c"
+        elif height < 45:
+            item["fill"] = "#38f"
+        else:
+            item["fill"] = "#2eccaa"
+        if i in opacities:
+            item["opacity"] = opacities[i]
+
+        bars.append(item)
+
+    content = render_to_string("svg/activity.svg", {"bars": bars}).encode()
+    # Weak ETag as the gzip variant shares it
+    result = {
+        "content": content,
+        "gzip": gzip.compress(content),
+        "etag": f'W/"{hashlib.sha256(content).hexdigest()}"',
+    }
+    cache.set(ACTIVITY_SVG_KEY, result, timeout=CACHE_TIMEOUT)
+    return result
+
+
+on_refresh("wlweb-activity-stats")(render_activity_svg)
+
+
+def get_activity_svg() -> dict:
+    result = cache.get(ACTIVITY_SVG_KEY)
+    # Rendered SVG is kept as long as the data, render it only on cold cache
+    if result is None:
+        result = render_activity_svg(get_activity())
+    return result
+
+
+def fetch_project_statistics(projects):
+    """Fetch statistics for projects concurrently."""
+    if not projects:
         return []
+    with ThreadPoolExecutor(max_workers=settings.CHANGES_WORKERS) as executor:
+        return list(
+            executor.map(lambda project: project.statistics().get_data(), projects)
+        )
 
-    stats = response.json()
-    data = stats[-25:]
-    cache.set(key, data, timeout=CACHE_TIMEOUT)
-    return data
 
+def get_project_fingerprint(project) -> str:
+    data = json.dumps(project.get_data(), sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def fetch_changes_incremental(projects, fetch_stats: dict):
+    """
+    Fetch statistics only for projects which might have changed.
+
+    The listing does not expose activity, so statistics are fetched for new or
+    modified projects, for the currently most active ones, and for the ones
+    not fetched in CHANGES_MAX_AGE. Others reuse previously fetched data.
+    """
+    previous = cache.get(CHANGES_PROJECTS_KEY, {})
+    recent = sorted(
+        (
+            (entry["stats"]["last_change"], slug)
+            for slug, entry in previous.items()
+            if entry["stats"].get("last_change") is not None
+        ),
+        reverse=True,
+    )
+    active = {slug for _last_change, slug in recent[:10]}
+    now = time.time()
+
+    current = {}
+    outdated = []
+    for project in projects:
+        slug = project["slug"]
+        fingerprint = get_project_fingerprint(project)
+        entry = previous.get(slug)
+        if (
+            entry is None
+            or entry["fingerprint"] != fingerprint
+            or entry["timestamp"] + CHANGES_MAX_AGE < now
+            or slug in active
+        ):
+            outdated.append((slug, fingerprint, project))
+        else:
+            current[slug] = entry
+
+    statistics = fetch_project_statistics([item[2] for item in outdated])
+    for (slug, fingerprint, _project), stats in zip(outdated, statistics):
+        current[slug] = {"fingerprint": fingerprint, "timestamp": now, "stats": stats}
+    fetch_stats["queried"] = len(outdated)
+
+    cache.set(CHANGES_PROJECTS_KEY, current, timeout=CACHE_TIMEOUT)
+    return [entry["stats"] for entry in current.values()]
+
+
+def fetch_changes(fetch_stats: dict):
+    def count_bytes(response, *args, **kwargs):
+        fetch_stats["bytes"] = fetch_stats.get("bytes", 0) + len(response.content)
 
-def get_changes(force: bool = False):
-    key = "wlweb-changes-list"
-    results = cache.get(key)
-    if not force and results is not None:
-        return results
     try:
-        wlc = Weblate(key=settings.CHANGES_KEY, url=settings.CHANGES_API)
+        wlc = Weblate(
+            key=settings.CHANGES_KEY,
+            url=settings.CHANGES_API,
+            timeout=fetch_stats.get("timeout", REQUEST_TIMEOUT),
+        )
+        wlc.session.hooks["response"].append(count_bytes)
 
-        stats = [p.statistics() for p in wlc.list_projects()]
-        stats = [p.get_data() for p in stats if p["last_change"] is not None]
+        projects = list(wlc.list_projects())
+        if settings.CHANGES_INCREMENTAL:
+            stats = fetch_changes_incremental(projects, fetch_stats)
+        else:
+            stats = fetch_project_statistics(projects)
+            fetch_stats["queried"] = len(projects)
     except WeblateException as error:
         sentry_sdk.capture_exception(error)
-        return []
+        fetch_stats["status"] = "error"
+        return None
+    fetch_stats["status"] = "ok"
 
+    stats = [p for p in stats if p.get("last_change") is not None]
     stats.sort(key=lambda x: x["last_change"], reverse=True)
 
-    cache.set(key, stats[:10], timeout=CACHE_TIMEOUT)
     return stats[:10]
 
 
-def get_release(force: bool = False) -> None | list[dict[str, str]]:
-    key = "wlweb-release-x"
-    results = cache.get(key)
-    if not force and results is not None:
-        return results
-    # Perform request
-    try:
-        response = requests.get(PYPI_URL, timeout=10)
-    except OSError as error:
-        sentry_sdk.capture_exception(error)
-        response = None
-    # Stats are not yet calculated
-    if response is None or response.status_code != 200:
+def get_changes(force: bool = False):
+    return get_cached("wlweb-changes-list", fetch_changes, force, [])
+
+
+def fetch_release(fetch_stats: dict) -> None | list[dict[str, str]]:
+    """
+    Fetch files of the most recently uploaded release from PyPI.
+
+    The document lists every file of every release, so it is parsed while
+    streaming and only files of the most recent release are kept in memory.
+    """
+    response = fetch_url(PYPI_URL, fetch_stats, stream=True)
+    if response is None:
         return None
 
     recent = None
     result = None
-    for info in response.json()["releases"].values():
-        if not info:
-            continue
-        timestamp = parse(info[0]["upload_time_iso_8601"])
-        if recent is None or timestamp > recent:
-            recent = timestamp
-            result = info
+    start = time.monotonic()
+    try:
+        response.raw.decode_content = True
+        for _version, info in ijson.kvitems(response.raw, "releases", use_float=True):
+            if not info:
+                continue
+            timestamp = parse(info[0]["upload_time_iso_8601"])
+            if recent is None or timestamp > recent:
+                recent = timestamp
+                result = info
+    except ijson.JSONError as error:
+        sentry_sdk.capture_exception(error)
+        fetch_stats["status"] = "error"
+        return None
+    finally:
+        fetch_stats["parse_time"] = time.monotonic() - start
+        fetch_stats["bytes"] = response.raw.tell()
+        response.close()
 
-    cache.set(key, result, timeout=CACHE_TIMEOUT)
     return result
+
+
+def get_release(force: bool = False) -> list[dict[str, str]]:
+    return get_cached("wlweb-release-x", fetch_release, force, [])
+
+
+# Remote sources refreshed by the background_fetch management command
+SOURCES = {
+    "contributors": ("wlweb-contributors", fetch_contributors),
+    "activity": ("wlweb-activity-stats", fetch_activity),
+    "changes": ("wlweb-changes-list", fetch_changes),
+    "release": ("wlweb-release-x", fetch_release),
+}
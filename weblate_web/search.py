@@ -0,0 +1,182 @@
+#
+# Copyright © Michal Čihař <michal@weblate.org>
+#
+# This file is part of Weblate <https://weblate.org/>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Full-text search for projects.
+
+The search lookup uses full-text capabilities of the database and the search
+backend matching the database vendor provides ranking. The indexes are
+maintained by the database.
+"""
+
+from __future__ import annotations
+
+import re
+
+from django.db import connection, models
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+
+TERM_RE = re.compile(r"\w+")
+
+
+def get_terms(query: str) -> list[str]:
+    return TERM_RE.findall(query)
+
+
+def sqlite_query(query: str) -> str:
+    """Prefix search for all terms, the terms are quoted to avoid FTS5 syntax."""
+    return " ".join(f'"{term}"*' for term in get_terms(query))
+
+
+def postgresql_query(query: str) -> str:
+    """Prefix search for all terms."""
+    return " & ".join(f"{term}:*" for term in get_terms(query))
+
+
+class SearchLookup(models.Lookup):
+    """
+    Full-text search lookup.
+
+    Falls back to substring matching on databases without full-text support.
+    """
+
+    lookup_name = "search"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        rhs_params = [f"%{connection.ops.prep_for_like_query(rhs_params[0])}%"]
+        return f"UPPER({lhs}) LIKE UPPER({rhs})", lhs_params + rhs_params
+
+    def as_mysql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        rhs_params = [rhs_params[0].replace("*", "")]
+        params = lhs_params + rhs_params
+        return f"MATCH ({lhs}) AGAINST ({rhs} IN NATURAL LANGUAGE MODE)", params
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        rhs_params = [postgresql_query(rhs_params[0])]
+        params = lhs_params + rhs_params
+        return f"to_tsvector('simple', {lhs}) @@ to_tsquery('simple', {rhs})", params
+
+    def as_sqlite(self, compiler, connection):
+        # The full-text table is maintained only for project names
+        model = self.lhs.target.model
+        if model._meta.db_table != "weblate_web_project":
+            return self.as_sql(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        query = sqlite_query(rhs_params[0])
+        if not query:
+            # Empty query is a syntax error for FTS5
+            return "1 = 0", []
+        pk = f"{self.lhs.alias}.{connection.ops.quote_name(model._meta.pk.column)}"
+        return (
+            f"{pk} IN (SELECT rowid FROM weblate_web_project_fts "  # noqa: S608
+            f"WHERE weblate_web_project_fts MATCH {rhs})",
+            [query],
+        )
+
+
+models.CharField.register_lookup(SearchLookup)
+
+
+class SearchBackend:
+    """Substring matching without index or ranking."""
+
+    def score(self, query: str):
+        """Return expression scoring the match, lower is better."""
+        return F("name")
+
+    def ordering(self, query: str) -> list:
+        """Return ordering expressions, the best matches first."""
+        return [F("name").asc(), F("pk").asc()]
+
+    def ranked(self, queryset, query: str):
+        """Return projects matching the query, the best matches first."""
+        if not get_terms(query):
+            return queryset.none()
+        return queryset.filter(name__search=query).order_by(*self.ordering(query))
+
+
+class MySQLSearchBackend(SearchBackend):
+    """MySQL fulltext index, maintained by the database."""
+
+    def rank(self, query: str):
+        return RawSQL(
+            "MATCH (weblate_web_project.name) AGAINST (%s IN NATURAL LANGUAGE MODE)",
+            (query.replace("*", ""),),
+            output_field=models.FloatField(),
+        )
+
+    def score(self, query: str):
+        return -self.rank(query)
+
+    def ordering(self, query: str) -> list:
+        return [self.rank(query).desc(), *super().ordering(query)]
+
+
+class PostgreSQLSearchBackend(SearchBackend):
+    """PostgreSQL GIN tsvector index, maintained by the database."""
+
+    def rank(self, query: str):
+        return RawSQL(
+            "ts_rank(to_tsvector('simple', weblate_web_project.name), "
+            "to_tsquery('simple', %s))",
+            (postgresql_query(query),),
+            output_field=models.FloatField(),
+        )
+
+    def score(self, query: str):
+        return -self.rank(query)
+
+    def ordering(self, query: str) -> list:
+        return [self.rank(query).desc(), *super().ordering(query)]
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """SQLite FTS5 table, maintained by triggers on the projects table."""
+
+    def score(self, query: str):
+        # Lower BM25 score is better
+        return RawSQL(
+            "SELECT bm25(weblate_web_project_fts) FROM weblate_web_project_fts "
+            "WHERE weblate_web_project_fts MATCH %s "
+            "AND weblate_web_project_fts.rowid = weblate_web_project.id",
+            (sqlite_query(query),),
+            output_field=models.FloatField(),
+        )
+
+    def ordering(self, query: str) -> list:
+        return [self.score(query).asc(), *super().ordering(query)]
+
+
+SEARCH_BACKENDS = {
+    "mysql": MySQLSearchBackend,
+    "postgresql": PostgreSQLSearchBackend,
+    "sqlite": SQLiteSearchBackend,
+}
+
+
+def get_search_backend(vendor: str | None = None) -> SearchBackend:
+    if vendor is None:
+        vendor = connection.vendor
+    return SEARCH_BACKENDS.get(vendor, SearchBackend)()
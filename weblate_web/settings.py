@@ -334,6 +334,24 @@ REGISTRATION_EMAIL_MATCH = ".*"
 
 CHANGES_API = "https://hosted.weblate.org/api/"
 CHANGES_KEY = ""
+# Number of concurrent project statistics requests
+CHANGES_WORKERS = 8
+# Fetch statistics only for projects which might have changed
+CHANGES_INCREMENTAL = False
+# Maximal number of public projects accepted in a single report
+PUBLIC_PROJECTS_LIMIT = 10000
+# Queue reports for the process_reports command instead of processing them
+REPORTS_ASYNC = False
+# Number of attempts to process a queued report before it is dropped
+REPORTS_RETRIES = 5
+# Number of days to keep full resolution reports, older are rolled up per day
+REPORTS_RETENTION_DAYS = 90
+# Number of days to keep daily report rollups, older are rolled up per month
+REPORTS_DAILY_RETENTION_DAYS = 730
+# Number of projects shown for each service on the discover page
+DISCOVER_PROJECTS = 20
+# Number of services shown on a single discover page
+DISCOVER_PAGE_SIZE = 50
 
 STORAGE_SERVER = {
     "hostname": "backups.weblate.cloud",
@@ -1,6 +1,12 @@
+import gzip
 import json
 import os
+import threading
+from concurrent.futures import wait
 from datetime import date, timedelta
+from io import StringIO
+from unittest.mock import ANY, patch
+from urllib.parse import quote
 from xml.etree import ElementTree
 
 import requests
@@ -12,7 +18,8 @@ from django.core import mail
 from django.core.cache import cache
 from django.core.management import call_command
 from django.core.signing import dumps
-from django.test import TestCase
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase
 from django.test.utils import override_settings
 from django.urls import reverse
 from django.utils import timezone
@@ -21,14 +28,48 @@ from django.utils.translation import override
 from payments.data import SUPPORTED_LANGUAGES
 from payments.models import Customer, Payment
 
+from .context_processors import get_language_urls
 from .management.commands.recurring_payments import Command as RecurringPaymentsCommand
-from .models import PAYMENTS_ORIGIN, Donation, Package, Post, Service
+from .middleware import SecurityMiddleware
+from .models import (
+    DISCOVER_KEY,
+    FOOTER_KEY,
+    PAYMENTS_ORIGIN,
+    Donation,
+    Package,
+    PastPayments,
+    PendingReport,
+    Post,
+    Project,
+    Report,
+    ReportRollup,
+    Service,
+    compact_reports,
+    get_subscription_status,
+    prefetch_payments,
+    process_pending_reports,
+    process_support_report,
+    refresh_discover,
+    search_discover,
+    update_discover,
+    update_services_status,
+)
 from .remote import (
     ACTIVITY_URL,
+    CHANGES_PROJECTS_KEY,
+    PYPI_URL,
+    SOURCES,
     WEBLATE_CONTRIBUTORS_URL,
+    fetch_release,
     get_activity,
+    get_changes,
     get_contributors,
+    is_stale,
+    refresh_background,
+    refresh_cached,
+    set_cached,
 )
+from .search import get_search_backend
 from .templatetags.downloads import downloadlink, filesizeformat
 
 TEST_DATA = os.path.join(os.path.dirname(__file__), "test-data")
@@ -59,9 +100,10 @@ def fake_remote():
             "address": "Zdiměřická 1439/8\nPRAHA 11 - CHODOV\n149 00  PRAHA 415",
         },
     )
-    cache.set("wlweb-contributors", [])
-    cache.set("wlweb-activity-stats", [])
-    cache.set(
+    set_cached("wlweb-contributors", [])
+    set_cached("wlweb-activity-stats", [])
+    cache.delete(FOOTER_KEY)
+    set_cached(
         "wlweb-changes-list",
         [
             {
@@ -235,6 +277,17 @@ class ViewTestCase(PostTestCase):
         response = self.client.get("/uk/contribute/")
         self.assertContains(response, "https://docs.weblate.org/uk/latest/contributing")
 
+    def test_language_urls(self):
+        get_language_urls.cache_clear()
+        response = self.client.get("/en/contribute/")
+        self.assertContains(response, 'hreflang="cs" href="/cs/contribute/"')
+        response = self.client.get("/cs/contribute/")
+        self.assertContains(response, 'hreflang="en" href="/en/contribute/"')
+        self.assertEqual(response.context["canonical_url"], "/contribute/")
+        info = get_language_urls.cache_info()
+        self.assertEqual(info.misses, 1)
+        self.assertEqual(info.hits, 1)
+
     @responses.activate
     def test_about(self):
         with open(TEST_CONTRIBUTORS) as handle:
@@ -261,6 +314,259 @@ class ViewTestCase(PostTestCase):
         response = self.client.get("/img/activity.svg")
         self.assertContains(response, "<svg")
 
+    @responses.activate
+    def test_activity_etag(self):
+        with open(TEST_ACTIVITY) as handle:
+            responses.add(responses.GET, ACTIVITY_URL, body=handle.read())
+        get_activity(force=True)
+        response = self.client.get("/img/activity.svg")
+        self.assertContains(response, "<rect")
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn("Accept-Encoding", response["Vary"])
+        # Conditional request
+        response = self.client.get("/img/activity.svg", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        # Compressed variant
+        response = self.client.get(
+            "/img/activity.svg", headers={"Accept-Encoding": "gzip, deflate"}
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["ETag"], etag)
+        self.assertIn(b"<rect", gzip.decompress(response.content))
+        # Served without rendering
+        with patch("weblate_web.remote.render_to_string") as mocked:
+            response = self.client.get("/img/activity.svg")
+        mocked.assert_not_called()
+        self.assertContains(response, "<rect")
+
+    @responses.activate
+    def test_footer(self):
+        user = User.objects.create(username="supporter")
+        with self.captureOnCommitCallbacks(execute=True):
+            donation = Donation.objects.create(
+                user=user,
+                reward=3,
+                link_text="Proud supporter",
+                link_url="https://example.com/",
+                expires=timezone.now() + timedelta(days=1),
+                active=True,
+            )
+        with self.assertNumQueries(0):
+            response = self.client.get("/en/donate/")
+        self.assertContains(response, "Proud supporter")
+        # Activity refresh updates the sum
+        with open(TEST_ACTIVITY) as handle:
+            responses.add(responses.GET, ACTIVITY_URL, body=handle.read())
+        get_activity(force=True)
+        response = self.client.get("/en/")
+        self.assertEqual(
+            response.context["footer"]["activity_sum"], sum(get_activity()[-7:])
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            donation.delete()
+        response = self.client.get("/en/donate/")
+        self.assertNotContains(response, "Proud supporter")
+
+    @responses.activate
+    def test_remote_failure_keeps_data(self):
+        cache.delete("wlweb-contributors-meta")
+        self.assertTrue(is_stale("wlweb-contributors"))
+        set_cached("wlweb-contributors", [{"rank": 1}])
+        self.assertFalse(is_stale("wlweb-contributors"))
+        responses.add(responses.GET, WEBLATE_CONTRIBUTORS_URL, status=500)
+        self.assertEqual(get_contributors(force=True), [{"rank": 1}])
+        self.assertEqual(cache.get("wlweb-contributors"), [{"rank": 1}])
+
+    @responses.activate
+    def test_remote_not_modified(self):
+        with open(TEST_ACTIVITY) as handle:
+            activity = handle.read()
+        responses.add(
+            responses.GET, ACTIVITY_URL, body=activity, headers={"ETag": '"v1"'}
+        )
+        get_activity(force=True)
+        meta = cache.get("wlweb-activity-stats-meta")
+        self.assertEqual(meta["validators"], {"etag": '"v1"'})
+        # Expire the data and revalidate it
+        meta["timestamp"] = 0
+        cache.set("wlweb-activity-stats-meta", meta)
+        self.assertTrue(is_stale("wlweb-activity-stats"))
+        responses.replace(responses.GET, ACTIVITY_URL, status=304)
+        self.assertEqual(get_activity(force=True), json.loads(activity)[-25:])
+        self.assertEqual(responses.calls[1].request.headers["If-None-Match"], '"v1"')
+        self.assertFalse(is_stale("wlweb-activity-stats"))
+
+        # Evicted data is stale regardless of the metadata
+        cache.delete("wlweb-activity-stats")
+        self.assertTrue(is_stale("wlweb-activity-stats"))
+        with patch("weblate_web.remote.refresh_background") as refresh:
+            self.assertEqual(get_activity(), [])
+        refresh.assert_called_once()
+        # Data evicted during revalidation is fetched again
+        set_cached("wlweb-activity-stats", [], {"etag": '"v1"'})
+        responses.replace(responses.GET, ACTIVITY_URL, status=304)
+        responses.add(responses.GET, ACTIVITY_URL, body=activity)
+        with patch.object(cache, "touch", return_value=False):
+            self.assertEqual(get_activity(force=True), json.loads(activity)[-25:])
+        self.assertNotIn("If-None-Match", responses.calls[-1].request.headers)
+        self.assertFalse(is_stale("wlweb-activity-stats"))
+
+    @responses.activate
+    def test_release(self):
+        def release(version, timestamp):
+            return [
+                {
+                    "filename": f"weblate-{version}.tar.gz",
+                    "size": 1000,
+                    "upload_time_iso_8601": timestamp,
+                    "url": f"https://example.com/weblate-{version}.tar.gz",
+                }
+            ]
+
+        responses.add(
+            responses.GET,
+            PYPI_URL,
+            json={
+                "info": {"version": "5.1"},
+                "releases": {
+                    "5.0.3": release("5.0.3", "2024-02-01T00:00:00.000000Z"),
+                    "5.1": release("5.1", "2024-01-01T00:00:00.000000Z"),
+                    "5.2": [],
+                },
+            },
+        )
+        stats = {}
+        result = fetch_release(stats)
+        self.assertEqual(result[0]["filename"], "weblate-5.0.3.tar.gz")
+        self.assertIn("parse_time", stats)
+        self.assertGreater(stats["bytes"], 0)
+
+    def test_remote_single_flight(self):
+        calls = []
+
+        def fetcher(stats):
+            calls.append(True)
+            return ["fetched"]
+
+        cache.add("wlweb-test-lock", True)
+        self.assertFalse(refresh_cached("wlweb-test", fetcher))
+        self.assertEqual(calls, [])
+        # Forced refresh does not release lock held by other worker
+        self.assertTrue(refresh_cached("wlweb-test", fetcher, force=True))
+        self.assertTrue(cache.get("wlweb-test-lock"))
+        # No thread is started while other worker is refreshing
+        with patch("weblate_web.remote.threading.Thread") as thread:
+            self.assertFalse(refresh_background("wlweb-test", fetcher))
+        thread.assert_not_called()
+        cache.delete("wlweb-test-lock")
+        self.assertTrue(refresh_cached("wlweb-test", fetcher))
+        self.assertEqual(cache.get("wlweb-test"), ["fetched"])
+        self.assertIsNone(cache.get("wlweb-test-lock"))
+
+        # Background refresh releases the lock it acquired
+        self.assertTrue(refresh_background("wlweb-test", fetcher))
+        for thread in threading.enumerate():
+            if thread.name == "refresh-wlweb-test":
+                thread.join()
+        self.assertEqual(len(calls), 3)
+        self.assertIsNone(cache.get("wlweb-test-lock"))
+
+    @responses.activate
+    def test_background_fetch(self):
+        with open(TEST_ACTIVITY) as handle:
+            activity = handle.read()
+        responses.add(responses.GET, ACTIVITY_URL, body=activity)
+        responses.add(responses.GET, WEBLATE_CONTRIBUTORS_URL, status=500)
+        output = StringIO()
+        call_command("background_fetch", parallel=True, stdout=output)
+        report = output.getvalue()
+        self.assertIn("activity: status 200", report)
+        self.assertIn("contributors: status 500", report)
+        self.assertIn("release: status error", report)
+        self.assertIn("peak memory", report)
+        self.assertEqual(get_activity(), json.loads(activity)[-25:])
+
+    @responses.activate
+    def test_background_fetch_timeout(self):
+        responses.add(responses.GET, ACTIVITY_URL, status=500)
+        responses.add(responses.GET, WEBLATE_CONTRIBUTORS_URL, status=500)
+        cache.delete("wlweb-test")
+        release = threading.Event()
+        timeouts = []
+
+        def fetcher(stats):
+            timeouts.append(stats["timeout"])
+            release.wait(10)
+            return ["late"]
+
+        SOURCES["slow"] = SOURCES["other"] = ("wlweb-test", fetcher)
+        output = StringIO()
+        with patch(
+            "weblate_web.management.commands.background_fetch.wait", wraps=wait
+        ) as waiter:
+            try:
+                call_command(
+                    "background_fetch", parallel=True, timeout=1, stdout=output
+                )
+            finally:
+                release.set()
+                del SOURCES["slow"], SOURCES["other"]
+                for thread in threading.enumerate():
+                    if thread.name.startswith("ThreadPoolExecutor"):
+                        thread.join()
+        # Single deadline for all sources
+        waiter.assert_called_once()
+        self.assertLessEqual(waiter.call_args.kwargs["timeout"], 1)
+        # HTTP requests are limited by the deadline
+        self.assertEqual(timeouts, [1, 1])
+        # Late results do not replace cached data
+        self.assertIsNone(cache.get("wlweb-test"))
+        report = output.getvalue()
+        self.assertIn("slow: status timeout", report)
+        self.assertIn("other: status timeout", report)
+        self.assertIn("activity: status 500", report)
+
+    @responses.activate
+    @override_settings(CHANGES_INCREMENTAL=True)
+    def test_changes_incremental(self):
+        cache.delete(CHANGES_PROJECTS_KEY)
+        projects = []
+        for i in range(12):
+            statistics_url = f"{settings.CHANGES_API}projects/p{i}/statistics/"
+            projects.append(
+                {
+                    "name": f"Project {i}",
+                    "slug": f"p{i}",
+                    "url": f"{settings.CHANGES_API}projects/p{i}/",
+                    "web": "https://example.com/",
+                    "statistics_url": statistics_url,
+                }
+            )
+            responses.add(
+                responses.GET,
+                statistics_url,
+                json={
+                    "name": f"Project {i}",
+                    "url": f"https://hosted.weblate.org/engage/p{i}/",
+                    "recent_changes": i,
+                    "last_change": f"2024-01-{i + 1:02d}T00:00:00Z",
+                },
+            )
+        responses.add(
+            responses.GET,
+            f"{settings.CHANGES_API}projects/",
+            json={"results": projects, "next": None},
+        )
+        changes = get_changes(force=True)
+        self.assertEqual(len(changes), 10)
+        self.assertEqual(changes[0]["name"], "Project 11")
+        self.assertEqual(len(responses.calls), 13)
+        # Only the most recently active projects are queried again
+        responses.calls.reset()
+        self.assertEqual(get_changes(force=True), changes)
+        self.assertEqual(len(responses.calls), 11)
+
     def test_download_en(self):
         response = self.client.get("/en/download/")
         self.assertContains(response, "Download Weblate")
@@ -364,6 +670,22 @@ class UtilTestCase(TestCase):
             },
         )
 
+    def test_security_middleware(self):
+        content = b'<a href="https://docs.weblate.org/en/latest/">Docs</a>'
+        middleware = SecurityMiddleware(lambda _request: HttpResponse(content))
+        with override("uk"):
+            response = middleware(RequestFactory().get("/uk/"))
+        self.assertIn(b"https://docs.weblate.org/uk/latest/", response.content)
+        self.assertIn("default-src 'self'", response["Content-Security-Policy"])
+
+        # Streaming response is passed untouched
+        middleware = SecurityMiddleware(
+            lambda _request: StreamingHttpResponse(iter([content]))
+        )
+        with override("uk"):
+            response = middleware(RequestFactory().get("/uk/"))
+        self.assertEqual(b"".join(response.streaming_content), content)
+
 
 class FakturaceTestCase(TestCase):
     databases = "__all__"
@@ -714,6 +1036,30 @@ class DonationTest(FakturaceTestCase):
         donation.refresh_from_db()
         self.assertGreater(donation.expires, old)
 
+    def test_prefetch_payments(self):
+        donations = [self.create_donation() for _i in range(3)]
+        Donation.objects.create(
+            user=self.create_user(), active=True, expires=timezone.now()
+        )
+        with self.assertNumQueries(1, using="payments_db"):
+            result = list(Donation.objects.order_by("pk").prefetch_payments("customer"))
+            self.assertEqual(
+                [donation.payment_obj.pk for donation in result[:3]],
+                [donation.payment for donation in donations],
+            )
+            self.assertIsNotNone(result[0].payment_obj.customer.email)
+        self.assertIsNone(result[3].payment_obj)
+
+        # Chunks are fetched separately, past payments are supported as well
+        for donation in donations:
+            donation.pastpayments_set.create(payment=donation.payment)
+        with self.assertNumQueries(2, using="payments_db"):
+            result = prefetch_payments(PastPayments.objects.all(), chunk_size=2)
+            self.assertEqual(
+                {payment.payment_obj.pk for payment in result},
+                {donation.payment for donation in donations},
+            )
+
 
 class PostTest(PostTestCase):
     def setUp(self):
@@ -744,6 +1090,9 @@ class APITest(TestCase):
     def test_hosted(self):
         Package.objects.create(name="community", verbose="Community support", price=0)
         Package.objects.create(name="shared:test", verbose="Test package", price=0)
+        self.post_hosted()
+
+    def post_hosted(self):
         response = self.client.post(
             "/api/hosted/",
             {
@@ -766,6 +1115,46 @@ class APITest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
 
+    def test_hosted_payments(self):
+        customer = Customer.objects.create(
+            email="weblate@example.com",
+            user_id=1,
+            origin=PAYMENTS_ORIGIN,
+        )
+        payments = [
+            Payment.objects.create(
+                customer=customer,
+                amount=100,
+                description="Hosted",
+                end=date(2024, month, 1),
+                extra={"billing": 42},
+            )
+            for month in (3, 1, 2)
+        ]
+        Payment.objects.create(
+            customer=customer, amount=100, description="Other", extra={"billing": 1}
+        )
+        self.assertEqual(Payment.objects.filter(billing=42).count(), 3)
+        # Rows written without save() are matched as well
+        Payment.objects.bulk_create(
+            [Payment(customer=customer, amount=100, extra={"billing": 43})]
+        )
+        Payment.objects.filter(billing=1).update(extra={"billing": 43})
+        self.assertEqual(Payment.objects.filter(billing=43).count(), 2)
+        Package.objects.create(name="community", verbose="Community support", price=0)
+        Package.objects.create(name="shared:test", verbose="Test package", price=0)
+        service = Service.objects.create(hosted_billing=42)
+        subscription = service.subscription_set.create(
+            package="shared:test", expires=timezone.now() + timedelta(days=1)
+        )
+        self.post_hosted()
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.payment, payments[0].pk)
+        self.assertEqual(
+            {past.payment for past in subscription.pastpayments_set.all()},
+            {payments[1].pk, payments[2].pk},
+        )
+
     def test_hosted_invalid(self):
         response = self.client.post("/api/hosted/", {"payload": dumps({}, key="dummy")})
         self.assertEqual(response.status_code, 400)
@@ -794,6 +1183,72 @@ class APITest(TestCase):
         self.assertEqual(response.json()["name"], expected)
         return service
 
+    @override_settings(REPORTS_ASYNC=True)
+    def test_support_async(self):
+        service = self.test_support()
+        self.assertEqual(service.report_set.count(), 0)
+        response = self.client.post(
+            "/api/support/",
+            {
+                "secret": service.secret,
+                "discoverable": "1",
+                "public_projects": json.dumps(
+                    [
+                        {
+                            "name": "Prj1",
+                            "url": "/projects/p/",
+                            "web": "https://weblate.org/",
+                        }
+                    ]
+                ),
+            },
+            HTTP_USER_AGENT="weblate/1.2.3",
+        )
+        self.assertEqual(response.json()["name"], "extended")
+        self.assertEqual(PendingReport.objects.count(), 2)
+        # Invalid reports are rejected
+        response = self.client.post(
+            "/api/support/",
+            {"secret": service.secret, "users": "x"},
+            HTTP_USER_AGENT="weblate/1.2.3",
+        )
+        self.assertEqual(response.status_code, 400)
+
+        output = StringIO()
+        call_command("process_reports", stdout=output)
+        self.assertEqual(output.getvalue(), "Processed 2 reports\n")
+        self.assertEqual(PendingReport.objects.count(), 0)
+        self.assertEqual(service.report_set.count(), 2)
+        service.refresh_from_db()
+        self.assertTrue(service.discoverable)
+        self.assertEqual(service.project_set.get().name, "Prj1")
+
+    @override_settings(REPORTS_RETRIES=2)
+    def test_support_async_retry(self):
+        service = self.test_support()
+        report = PendingReport.objects.create(
+            service=service, kind=PendingReport.SUPPORT, payload={}
+        )
+        self.assertEqual(process_pending_reports(), 0)
+        report.refresh_from_db()
+        self.assertEqual(report.attempts, 1)
+        self.assertEqual(report.error, "'report'")
+        with self.assertLogs("weblate_web.models", "ERROR"):
+            self.assertEqual(process_pending_reports(), 0)
+        self.assertFalse(PendingReport.objects.exists())
+
+    @patch("weblate_web.models.Service.create_backup")
+    def test_support_backup(self, create_backup):
+        service = self.test_support()
+        create_backup.reset_mock()
+        with self.captureOnCommitCallbacks() as callbacks:
+            process_support_report(service, {"report": {}})
+            # Backup is created only once the report is committed
+            create_backup.assert_not_called()
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        create_backup.assert_called_once()
+
     def test_support_expired(self):
         self.test_support(delta=-1, expected="community")
 
@@ -820,23 +1275,27 @@ class APITest(TestCase):
         service = self.test_support()
         service = Service.objects.get(pk=service.pk)
         self.assertFalse(service.discoverable)
-        self.client.post(
-            "/api/support/",
-            {
-                "secret": service.secret,
-                "discoverable": "1",
-                "public_projects": json.dumps(
-                    [
-                        {
-                            "name": "Prj1",
-                            "url": "/projects/p/",
-                            "web": "https://weblate.org/",
-                        }
-                    ]
-                ),
-            },
-            HTTP_USER_AGENT="weblate/1.2.3",
-        )
+        with self.assertLogs("weblate_web.models", "INFO") as logs:
+            response = self.client.post(
+                "/api/support/",
+                {
+                    "secret": service.secret,
+                    "discoverable": "1",
+                    "public_projects": json.dumps(
+                        [
+                            {
+                                "name": "Prj1",
+                                "url": "/projects/p/",
+                                "web": "https://weblate.org/",
+                            }
+                        ]
+                    ),
+                },
+                HTTP_USER_AGENT="weblate/1.2.3",
+            )
+        # Synchronization details are logged, not exposed in the API
+        self.assertNotIn("public_projects", response.json())
+        self.assertIn("1 created, 0 deleted", logs.output[0])
         self.assertEqual(service.project_set.count(), 1)
         project = service.project_set.get()
         self.assertEqual(project.name, "Prj1")
@@ -861,6 +1320,185 @@ class APITest(TestCase):
         project = service.project_set.get()
         self.assertEqual(project.name, "Prj2")
 
+    @override_settings(DISCOVER_PROJECTS=1)
+    def test_discover(self):
+        cache.delete(DISCOVER_KEY)
+        cache.delete(f"{DISCOVER_KEY}-stale")
+        self.client.get("/en/discover/")
+        self.test_support_discovery_projects()
+        service = Service.objects.get()
+        # Reports only invalidate the listing, it is rebuilt in the background
+        self.assertNotContains(self.client.get("/en/discover/"), "Prj2")
+        self.assertTrue(refresh_discover())
+        self.assertFalse(refresh_discover())
+        self.assertContains(self.client.get("/en/discover/"), "Prj2")
+        service.project_set.create(name="Prj3", url="/projects/3/", web="")
+        self.assertNotContains(self.client.get("/en/discover/"), "Prj3")
+        update_discover()
+        with self.assertNumQueries(0):
+            response = self.client.get("/en/discover/")
+        self.assertContains(response, f'id="d{service.pk}"')
+        self.assertEqual(len(response.context["discoverable_services"]), 1)
+        self.assertEqual(
+            len(response.context["discoverable_services"][0]["matched_projects"]), 1
+        )
+        response = self.client.get("/en/discover/", {"q": "prj3"})
+        self.assertContains(response, "Prj3")
+        self.assertNotContains(response, "Prj2")
+
+    @override_settings(PUBLIC_PROJECTS_LIMIT=100)
+    def test_sync_projects(self):
+        def make_projects(names):
+            return [
+                {
+                    "name": f"Project {name}",
+                    "url": f"/projects/{name}/",
+                    "web": "https://weblate.org/",
+                }
+                for name in names
+            ]
+
+        service = Service.objects.create()
+        with self.assertNumQueries(4):
+            stats = service.sync_projects(make_projects(range(50)))
+        self.assertEqual(stats["created"], 50)
+        self.assertEqual(stats["deleted"], 0)
+        self.assertIn("duration", stats)
+
+        # Constant number of queries regardless of the difference size
+        with self.assertNumQueries(5):
+            stats = service.sync_projects(
+                [*make_projects(range(30, 80)), {"name": "Invalid"}]
+            )
+        self.assertEqual(stats["created"], 30)
+        self.assertEqual(stats["deleted"], 30)
+        self.assertEqual(
+            set(service.project_set.values_list("name", flat=True)),
+            {f"Project {i}" for i in range(30, 80)},
+        )
+
+        # Reports are capped
+        stats = service.sync_projects(make_projects(range(200)))
+        self.assertEqual(service.project_set.count(), 100)
+
+    def test_search(self):
+        service = Service.objects.create(discoverable=True)
+        service.sync_projects(
+            [
+                {"name": name, "url": f"/projects/{i}/", "web": ""}
+                for i, name in enumerate(
+                    ["Weblate", "Weblate Website", "Hello", "Weblate Hello Weblate"]
+                )
+            ]
+        )
+        # Index is updated on save
+        project = service.project_set.get(name="Hello")
+        project.name = "Hello World"
+        project.save()
+
+        # Index is updated on delete, including cascades
+        other = Service.objects.create(discoverable=True)
+        other.project_set.create(name="Orphan", url="/projects/orphan/", web="")
+        other.delete()
+        self.assertFalse(Project.objects.filter(name__search="orphan").exists())
+        project = service.project_set.create(name="Removed", url="/removed/", web="")
+        project.delete()
+        self.assertFalse(Project.objects.filter(name__search="removed").exists())
+        # New projects can reuse row IDs of the deleted ones
+        project = service.project_set.create(name="Other", url="/other/", web="")
+        self.assertFalse(Project.objects.filter(name__search="removed").exists())
+        self.assertEqual(list(Project.objects.filter(name__search="other")), [project])
+
+        search = get_search_backend()
+        self.assertEqual(
+            {project.name for project in search.ranked(Project.objects.all(), "web")},
+            {"Weblate", "Weblate Website", "Weblate Hello Weblate"},
+        )
+        self.assertEqual(
+            [project.name for project in search.ranked(Project.objects.all(), "world")],
+            ["Hello World"],
+        )
+        self.assertEqual(
+            list(search.ranked(Project.objects.all(), "hello website")), []
+        )
+        self.assertEqual(list(search.ranked(Project.objects.all(), '"*')), [])
+        self.assertEqual(
+            Project.objects.filter(name__search="weblate website").get().name,
+            "Weblate Website",
+        )
+
+        response = self.client.get("/en/discover/", {"q": "world"})
+        self.assertContains(response, "Hello World")
+        self.assertNotContains(response, "Weblate Website")
+
+    @override_settings(DISCOVER_PAGE_SIZE=2, DISCOVER_PROJECTS=2)
+    def test_discover_pages(self):
+        cache.delete(DISCOVER_KEY)
+        services = []
+        for discoverable in (True, False, True, True):
+            service = Service.objects.create(
+                discoverable=discoverable, site_projects=10
+            )
+            service.sync_projects(
+                [
+                    {"name": f"Weblate {i}", "url": f"/projects/{i}/", "web": ""}
+                    for i in range(3)
+                ]
+            )
+            if discoverable:
+                services.append(service)
+
+        with self.assertNumQueries(3):
+            page, cursor = search_discover("weblate")
+        self.assertEqual([entry["pk"] for entry in page], [s.pk for s in services[:2]])
+        self.assertIsNotNone(cursor)
+        self.assertEqual(len(page[0]["matched_projects"]), 2)
+        # 10 projects, 3 matching and 2 of them shown
+        self.assertEqual(page[0]["non_matched_projects_count"], 7)
+
+        second_cursor = cursor
+        page, cursor = search_discover("weblate", cursor)
+        self.assertEqual([entry["pk"] for entry in page], [services[2].pk])
+        self.assertIsNone(cursor)
+        self.assertEqual(search_discover("missing"), ([], None))
+
+        # Pages are not shifted by services removed from the first page
+        Service.objects.filter(pk=services[0].pk).update(discoverable=False)
+        page, cursor = search_discover("weblate", second_cursor)
+        self.assertEqual([entry["pk"] for entry in page], [services[2].pk])
+        Service.objects.filter(pk=services[0].pk).update(discoverable=True)
+        self.assertEqual(
+            search_discover("weblate", "invalid"), search_discover("weblate")
+        )
+
+        response = self.client.get("/en/discover/", {"q": "weblate"})
+        self.assertContains(response, f"after={quote(second_cursor)}")
+        response = self.client.get(
+            "/en/discover/", {"q": "weblate", "after": second_cursor}
+        )
+        self.assertContains(response, f'id="d{services[2].pk}"')
+        self.assertNotContains(response, "after=")
+
+        response = self.client.get("/en/discover/")
+        self.assertContains(response, f'id="d{services[1].pk}"')
+        self.assertNotContains(response, f'id="d{services[2].pk}"')
+        response = self.client.get("/en/discover/", {"after": "invalid"})
+        self.assertEqual(response.status_code, 200)
+
+        # Services are ordered by their best matching project
+        services[0].sync_projects(
+            [{"name": "Hello Weblate", "url": "/projects/hello/", "web": ""}]
+        )
+        page, cursor = search_discover("hello")
+        self.assertEqual([entry["pk"] for entry in page], [services[0].pk])
+        services[2].sync_projects(
+            [{"name": "Hello", "url": "/projects/hello/", "web": ""}]
+        )
+        page, cursor = search_discover("hello")
+        self.assertEqual(
+            [entry["pk"] for entry in page], [services[2].pk, services[0].pk]
+        )
+
     def test_user(self):
         user = User.objects.create(
             username="testuser",
@@ -999,6 +1637,33 @@ class ExpiryTest(FakturaceTestCase):
         RecurringPaymentsCommand.notify_expiry()
         self.assert_notifications("Your upcoming payment on weblate.org")
 
+    def test_expiry_queries(self):
+        service = self.create_service(years=0, days=3, recurring="")
+        self.create_donation(years=0, days=3, recurring="")
+        stats = RecurringPaymentsCommand.notify_expiry()
+        self.assert_notifications("Expiring subscriptions on weblate.org")
+
+        # Obsolete subscription is not reported
+        service.subscription_set.create(
+            package="extended",
+            expires=timezone.now() + relativedelta(years=1),
+            payment=self.create_payment()[0].pk,
+        )
+        for _i in range(3):
+            other = Service.objects.create()
+            other.users.add(self.create_user())
+            other.subscription_set.create(
+                package="extended",
+                expires=timezone.now() + relativedelta(days=3),
+                payment=self.create_payment(recurring="")[0].pk,
+            )
+            self.create_donation(years=0, days=3, recurring="")
+        self.assertEqual(
+            RecurringPaymentsCommand.notify_expiry(), stats | {"duration": ANY}
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].body.count("Extended support"), 3)
+
 
 @override_settings(
     NOTIFY_SUBSCRIPTION=["noreply@example.com"],
@@ -1033,3 +1698,144 @@ class ServiceTest(FakturaceTestCase):
         hosted = service.hosted_subscriptions
         self.assertEqual(len(hosted), 1)
         self.assertEqual(hosted[0].package, "hosted:test-2")
+
+
+class ServiceStatusTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        Package.objects.create(name="community", verbose="Community support", price=0)
+        Package.objects.create(name="extended", verbose="Extended support", price=42)
+        Package.objects.create(
+            name="hosted:test",
+            verbose="Hosted",
+            price=42,
+            limit_hosted_words=1000,
+            limit_projects=1,
+        )
+
+    def test_subscription_status(self):
+        now = timezone.now()
+        self.assertEqual(get_subscription_status([]), ("community", "community", False))
+        self.assertEqual(
+            get_subscription_status([("extended", now), ("backup", now)]),
+            ("extended", "community", True),
+        )
+        self.assertEqual(
+            get_subscription_status(
+                [
+                    ("extended", now),
+                    ("hosted:test", now),
+                    ("hosted:test-2", now - timedelta(days=1)),
+                ]
+            ),
+            ("hosted", "hosted:test", True),
+        )
+
+    def test_update_status(self):
+        service = Service.objects.create()
+        service.subscription_set.create(
+            package="hosted:test", expires=timezone.now() + timedelta(days=1)
+        )
+        service.refresh_from_db()
+        self.assertEqual(service.status, "hosted")
+        self.assertEqual(service.limit_hosted_words, 1000)
+        with self.assertNumQueries(2):
+            status = service.update_status()
+        self.assertTrue(status.backup)
+
+    def test_update_services_status(self):
+        outdated = Service.objects.create()
+        outdated.subscription_set.create(
+            package="hosted:test", expires=timezone.now() + timedelta(days=1)
+        )
+        Service.objects.create()
+        Service.objects.filter(pk=outdated.pk).update(status="extended")
+        with self.assertNumQueries(4):
+            changed = update_services_status()
+        self.assertEqual(changed, [outdated])
+        outdated.refresh_from_db()
+        self.assertEqual(outdated.status, "hosted")
+        self.assertEqual(outdated.limit_projects, 1)
+
+    @patch("weblate_web.models.create_backup_repository", return_value="ssh://backup")
+    def test_handle_services(self, create_backup_repository):
+        service = Service.objects.create()
+        service.subscription_set.create(
+            package="hosted:test", expires=timezone.now() + timedelta(days=1)
+        )
+        service.report_set.create()
+        Service.objects.create().report_set.create()
+        Service.objects.filter(pk=service.pk).update(status="community")
+        self.assertEqual(RecurringPaymentsCommand.handle_services(), 1)
+        create_backup_repository.assert_called_once()
+        service.refresh_from_db()
+        self.assertEqual(service.status, "hosted")
+        self.assertEqual(service.backup_repository, "ssh://backup")
+        # Nothing changes on second run
+        self.assertEqual(RecurringPaymentsCommand.handle_services(), 0)
+        create_backup_repository.assert_called_once()
+
+
+@override_settings(REPORTS_RETENTION_DAYS=10, REPORTS_DAILY_RETENTION_DAYS=100)
+class ReportRollupTest(TestCase):
+    def create_report(self, service, days, **kwargs):
+        report = service.report_set.create(**kwargs)
+        Report.objects.filter(pk=report.pk).update(
+            timestamp=timezone.now() - timedelta(days=days)
+        )
+        return report
+
+    def test_latest_report(self):
+        service = Service.objects.create()
+        self.assertIsNone(service.last_report)
+        older = self.create_report(service, 5, site_url="https://old.example.com/")
+        report = service.report_set.create(site_url="https://example.com/")
+        service = Service.objects.get(pk=service.pk)
+        self.assertEqual(service.last_report, report)
+        # Older reports do not replace the latest one
+        older.refresh_from_db()
+        older.save()
+        service = Service.objects.get(pk=service.pk)
+        self.assertEqual(service.last_report, report)
+        self.assertEqual(service.site_url, "https://example.com/")
+        # Previous report becomes the latest one on removal
+        report.delete()
+        service = Service.objects.get(pk=service.pk)
+        self.assertEqual(service.last_report, older)
+        older.delete()
+        service = Service.objects.get(pk=service.pk)
+        self.assertIsNone(service.last_report)
+
+    def test_compact(self):
+        service = Service.objects.create()
+        # Old reports within single day and month
+        self.create_report(service, 200, users=1)
+        self.create_report(service, 200, users=5)
+        self.create_report(service, 20, projects=2)
+        self.create_report(service, 20, projects=3)
+        recent = self.create_report(service, 1)
+        # Latest report is kept regardless of age
+        other = Service.objects.create()
+        kept = self.create_report(other, 300)
+
+        output = StringIO()
+        call_command("compact_reports", chunk_size=2, stdout=output)
+        self.assertEqual(output.getvalue(), "Rolled up 4 reports and 1 daily rollups\n")
+        self.assertEqual(
+            set(Report.objects.values_list("pk", flat=True)), {recent.pk, kept.pk}
+        )
+        daily = ReportRollup.objects.get(period=ReportRollup.DAY)
+        self.assertEqual(daily.reports, 2)
+        self.assertEqual(daily.projects, 3)
+        monthly = ReportRollup.objects.get(period=ReportRollup.MONTH)
+        self.assertEqual(monthly.reports, 2)
+        self.assertEqual(monthly.users, 5)
+        self.assertEqual(monthly.start.day, 1)
+
+        # Repeated run merges into existing rollups
+        self.create_report(service, 20, projects=7)
+        self.create_report(service, 0)
+        self.assertEqual(compact_reports(), {"reports": 1, "days": 0})
+        daily.refresh_from_db()
+        self.assertEqual(daily.reports, 3)
+        self.assertEqual(daily.projects, 7)
@@ -18,7 +18,6 @@
 #
 
 import json
-import random
 
 import django.views.defaults
 from django.conf import settings
@@ -29,17 +28,18 @@ from django.contrib.auth.views import LogoutView
 from django.core.exceptions import SuspiciousOperation, ValidationError
 from django.core.mail import mail_admins
 from django.core.signing import BadSignature, SignatureExpired, loads
-from django.db import connection, transaction
+from django.db import transaction
 from django.db.models import Q
 from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
 from django.utils.translation import gettext, override
 from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import condition, require_POST
 from django.views.generic import TemplateView
 from django.views.generic.dates import ArchiveIndexView
 from django.views.generic.detail import DetailView, SingleObjectMixin
@@ -60,18 +60,22 @@ from weblate_web.forms import (
 )
 from weblate_web.models import (
     PAYMENTS_ORIGIN,
+    REPORT_PROCESSORS,
     REWARD_LEVELS,
     TOPIC_DICT,
     Donation,
     Package,
+    PendingReport,
     Post,
-    Project,
     Service,
     Subscription,
+    get_discover_page,
     process_donation,
     process_subscription,
+    search_discover,
+    update_discover,
 )
-from weblate_web.remote import get_activity
+from weblate_web.remote import get_activity_svg
 
 ON_EACH_SIDE = 3
 ON_ENDS = 2
@@ -183,97 +187,66 @@ def api_hosted(request):
     # Get/create service for this billing
     service = Service.objects.get_or_create(hosted_billing=payload["billing"])[0]
 
-    # TODO: This is temporary hack for payments migration period
-    payments = [
-        payment.pk
-        for payment in Payment.objects.order_by("end").iterator()
-        if payment.extra.get("billing", -1) == payload["billing"]
-    ]
-    if payments:
-        # Create/update subscription
-        subscription = Subscription.objects.get_or_create(
-            service=service,
-            package=payload["package"],
-            defaults={"payment": payments[-1]},
-        )[0]
-        if subscription.payment != payments[-1]:
-            subscription.payment = payments[-1]
-            subscription.save(update_fields=["payment"])
-        # Link past payments
-        for payment in payments[:-1]:
-            subscription.pastpayment_set.get_or_create(payment=payment)
-
-    # Link users which are supposed to have access
-    for user in payload["users"]:
-        service.users.add(User.objects.get_or_create(username=user)[0])
-
-    # Collect stats
-    service.report_set.create(
-        site_url="https://hosted.weblate.org/",
-        site_title="Hosted Weblate",
-        projects=payload["projects"],
-        components=payload["components"],
-        languages=payload["languages"],
-        source_strings=payload["source_strings"],
-        hosted_words=payload["words"],
-        hosted_strings=payload.get("strings", 0),
-        version=request.headers["User-Agent"].split("/", 1)[1],
-    )
-    service.update_status()
-    return JsonResponse(
-        data={
-            "name": service.status,
-            "expiry": service.expires,
-            "backup_repository": service.backup_repository,
-            "in_limits": service.check_in_limits(),
-            "limits": service.get_limits(),
-        }
-    )
+    payload["report"] = {
+        "site_url": "https://hosted.weblate.org/",
+        "site_title": "Hosted Weblate",
+        "projects": payload["projects"],
+        "components": payload["components"],
+        "languages": payload["languages"],
+        "source_strings": payload["source_strings"],
+        "hosted_words": payload["words"],
+        "hosted_strings": payload.get("strings", 0),
+        "version": request.headers["User-Agent"].split("/", 1)[1],
+    }
+    return process_report(service, PendingReport.HOSTED, payload)
 
 
 @require_POST
 @csrf_exempt
 def api_support(request):
     service = get_object_or_404(Service, secret=request.POST.get("secret", ""))
-    service.report_set.create(
-        site_url=request.POST.get("site_url", ""),
-        site_title=request.POST.get("site_title", ""),
-        ssh_key=request.POST.get("ssh_key", ""),
-        users=request.POST.get("users", 0),
-        projects=request.POST.get("projects", 0),
-        components=request.POST.get("components", 0),
-        languages=request.POST.get("languages", 0),
-        source_strings=request.POST.get("source_strings", 0),
-        hosted_words=request.POST.get("words", 0),
-        hosted_strings=request.POST.get("strings", 0),
-        version=request.headers["User-Agent"].split("/", 1)[1],
-        discoverable=bool(request.POST.get("discoverable")),
-    )
-    service.update_status()
-    service.create_backup()
-    if "public_projects" in request.POST:
-        current_projects = set(service.project_set.values_list("name", "url", "web"))
-        for project in json.loads(request.POST["public_projects"]):
-            # Skip unexpected data
-            if set(project) != {"name", "web", "url"}:
-                continue
-            item = (project["name"], project["url"], project["web"])
-            # Non-changed project
-            if item in current_projects:
-                current_projects.remove(item)
-                continue
-            # New project
-            service.project_set.create(**project)
-        # Remove stale projects
-        for name, url, web in current_projects:
-            service.project_set.filter(name=name, url=url, web=web).delete()
+    try:
+        payload = {
+            "report": {
+                "site_url": request.POST.get("site_url", ""),
+                "site_title": request.POST.get("site_title", ""),
+                "ssh_key": request.POST.get("ssh_key", ""),
+                "users": int(request.POST.get("users", 0)),
+                "projects": int(request.POST.get("projects", 0)),
+                "components": int(request.POST.get("components", 0)),
+                "languages": int(request.POST.get("languages", 0)),
+                "source_strings": int(request.POST.get("source_strings", 0)),
+                "hosted_words": int(request.POST.get("words", 0)),
+                "hosted_strings": int(request.POST.get("strings", 0)),
+                "version": request.headers["User-Agent"].split("/", 1)[1],
+                "discoverable": bool(request.POST.get("discoverable")),
+            }
+        }
+        if "public_projects" in request.POST:
+            payload["public_projects"] = json.loads(request.POST["public_projects"])
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    return process_report(service, PendingReport.SUPPORT, payload)
+
+
+def process_report(service, kind, payload):
+    """
+    Process report or queue it for processing.
+
+    Queued reports are answered using the current service status.
+    """
+    if settings.REPORTS_ASYNC:
+        PendingReport.objects.create(service=service, kind=kind, payload=payload)
+    else:
+        REPORT_PROCESSORS[kind](service, payload)
 
     return JsonResponse(
         data={
             "name": service.status,
             "expiry": service.expires,
             "backup_repository": service.backup_repository,
-            "in_limits": service.check_in_limits(),
+            # Queued report might be the first one
+            "in_limits": service.last_report is None or service.check_in_limits(),
             "limits": service.get_limits(),
         }
     )
@@ -585,7 +558,10 @@ class EditDiscoveryView(UpdateView):
                 discover_text=form.cleaned_data.get("discover_text", "N/A"),
             ),
         )
-        return super().form_valid(form)
+        result = super().form_valid(form)
+        if form.instance.discoverable:
+            update_discover()
+        return result
 
 
 @method_decorator(login_required, name="dispatch")
@@ -684,39 +660,25 @@ def server_error(request):
         return django.views.defaults.server_error(request)
 
 
-@cache_control(max_age=3600)
-def activity_svg(request):
-    bars = []
-    opacities = {0: ".1", 1: ".3", 2: ".5", 3: ".7"}
-    data = get_activity()
-    top_count = max(data) if data else 0
-    for i, count in enumerate(data):
-        height = int(76 * count / top_count)
-        item = {
-            "rx": 2,
-            "width": 6,
-            "height": height,
-            "id": f"b{i}",
-            "x": 10 * i,
-            "y": 86 - height,
-        }
-        if height < 20:
-            item["fill"] = "#f6664c"
-        elif height < 45:
-            item["fill"] = "#38f"
-        else:
-            item["fill"] = "#2eccaa"
-        if i in opacities:
-            item["opacity"] = opacities[i]
+def activity_svg_etag(_request):
+    return get_activity_svg()["etag"]
 
-        bars.append(item)
 
-    return render(
-        request,
-        "svg/activity.svg",
-        {"bars": bars},
-        content_type="image/svg+xml; charset=utf-8",
-    )
+@cache_control(max_age=3600)
+@condition(etag_func=activity_svg_etag)
+def activity_svg(request):
+    svg = get_activity_svg()
+    if "gzip" in request.headers.get("Accept-Encoding", ""):
+        response = HttpResponse(
+            svg["gzip"], content_type="image/svg+xml; charset=utf-8"
+        )
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(
+            svg["content"], content_type="image/svg+xml; charset=utf-8"
+        )
+    patch_vary_headers(response, ("Accept-Encoding",))
+    return response
 
 
 @require_POST
@@ -816,39 +778,20 @@ class DiscoverView(TemplateView):
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
-        services = Service.objects.filter(discoverable=True).prefetch_related(
-            "project_set"
-        )
         query = self.request.GET.get("q", "").strip().lower()
+        after = self.request.GET.get("after", "")
         if query:
-            projects = Project.objects.filter(
-                service__discoverable=True
-            ).prefetch_related("service")
-            if connection.vendor == "mysql":
-                projects = projects.filter(name__search=query.replace("*", ""))
-            else:
-                projects = projects.filter(name__icontains=query)
-            services_dict = {}
-            for project in projects:
-                service = services_dict[project.service_id] = project.service
-                if not hasattr(service, "matched_projects"):
-                    service.matched_projects = []
-                service.matched_projects.append(project)
-
-            services = list(services_dict.values())
+            services, cursor = search_discover(query, after)
         else:
-            for service in services:
-                projects = list(service.project_set.all())
-                if len(projects) > 20:
-                    projects = random.sample(projects, 20)
-                service.matched_projects = projects
-        for service in services:
-            service.non_matched_projects_count = service.site_projects - len(
-                service.matched_projects
-            )
+            try:
+                after = int(after or "0")
+            except ValueError:
+                after = 0
+            services, cursor = get_discover_page(after)
 
         data["discoverable_services"] = services
         data["query"] = query
+        data["next_cursor"] = cursor
         if self.request.user.is_authenticated:
             data["user_services"] = set(
                 self.request.user.service_set.values_list("pk", flat=True)